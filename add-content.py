@@ -4,9 +4,11 @@ Helper script to add new study guide content to the app.
 This script automatically:
 1. Copies markdown files from Subjects/ to docs/Subjects/
 2. Updates the manifest.json file
+3. Compiles the study guide app's content corpus for fast startup
 """
 
 import os
+import sys
 import json
 import shutil
 from pathlib import Path
@@ -77,6 +79,20 @@ def update_manifest():
         for topic in subject["topics"]:
             print(f"    - {topic['title']}")
 
+def compile_corpus():
+    """Compile Subjects/ into study-guide-app/data/corpus.jsonl."""
+    sys.path.insert(0, str(Path("study-guide-app").resolve()))
+    try:
+        from services.content_scanner import ContentScanner
+    except ImportError as e:
+        print(f"⚠ Skipped compiling the app corpus ({e})")
+        print("  Install study-guide-app/requirements.txt to enable it")
+        return
+
+    scanner = ContentScanner(subjects_path="Subjects")
+    count = scanner.compile_corpus()
+    print(f"✓ Compiled {count} topics into {scanner.corpus_path}")
+
 def main():
     print("=" * 60)
     print("  Study Guide App - Content Sync Tool")
@@ -97,6 +113,9 @@ def main():
     # Update manifest
     update_manifest()
 
+    # Pre-parse content for the Flask app
+    compile_corpus()
+
     print()
     print("=" * 60)
     print("✓ Sync complete!")
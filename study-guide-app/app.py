@@ -1,17 +1,29 @@
-from flask import Flask, jsonify, request, render_template, send_from_directory
+from flask import Flask, Response, g, jsonify, request, render_template, send_from_directory, stream_with_context
 from flask_cors import CORS
+import base64
+import hashlib
+import json
 import os
+import time
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Callable, Dict, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 # Import services
-from services.content_scanner import ContentScanner
+from services.content_scanner import DERIVED_CACHE, ContentScanner
+from services.content_watcher import ContentWatcher
 from services.question_generator import LocalQuestionGenerator
 from services.api_question_generator import APIQuestionGenerator
-from services.progress_tracker import ProgressTracker
+from services.grading import AnswerKey
+from services.progress_tracker import DEFAULT_STUDENT, ProgressRegistry, ProgressTracker
+from services.cache import LRUCache
+from services.response_cache import ResponseCache
+from services.question_bank import QuestionBank
+from services import grading, metrics
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -19,15 +31,95 @@ CORS(app)
 
 # Initialize services
 scanner = ContentScanner()
+content_watcher = ContentWatcher(scanner)
 local_generator = LocalQuestionGenerator()
-api_generator_openai = APIQuestionGenerator(provider='openai')
-api_generator_anthropic = APIQuestionGenerator(provider='anthropic')
-progress_tracker = ProgressTracker()
+# Generated questions/flashcards, keyed by a hash of provider, model and prompt
+api_response_cache = None
+if os.getenv('API_CACHE', 'true').lower() != 'false':
+    api_response_cache = ResponseCache(
+        ttl_seconds=int(os.getenv('API_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+        max_entries=int(os.getenv('API_CACHE_MAX_ENTRIES', '1000'))
+    )
+# 'stub' answers offline with placeholder questions, for testing without an API key;
+# only offered when API_STUB_PROVIDER=true
+api_providers = ['openai', 'anthropic']
+if os.getenv('API_STUB_PROVIDER', 'false').lower() == 'true':
+    api_providers.append('stub')
+api_generators = {
+    provider: APIQuestionGenerator(provider=provider, response_cache=api_response_cache)
+    for provider in api_providers
+}
+# Seconds a request waits for the API before falling back to local generation
+api_deadline_seconds = float(os.getenv('API_DEADLINE_SECONDS', '15'))
+# Progress trackers of recently active students
+progress_registry = ProgressRegistry(max_students=int(os.getenv('PROGRESS_MAX_STUDENTS', '64')))
+
+# Serialized seeded quizzes, keyed by quiz_id
+quiz_cache = LRUCache(max_entries=512)
+# Normalized answer keys of seeded quizzes, keyed by quiz_id
+answer_key_cache = LRUCache(max_entries=512)
+# Serialized subject/topic responses, keyed by content version
+response_cache = LRUCache(max_entries=256)
+
+# Keep the content index in memory and update it from file events
+if os.getenv('WATCH_CONTENT', 'true').lower() != 'false':
+    content_watcher.start()
+
+# Pre-generated AI questions and flashcards for every topic, refreshed on content changes
+question_bank = None
+if os.getenv('QUESTION_BANK', 'false').lower() == 'true':
+    bank_provider = os.getenv('QUESTION_BANK_PROVIDER', 'openai')
+    bank_generator = api_generators.get(bank_provider)
+    if bank_generator is not None and bank_generator.is_available():
+        question_bank = QuestionBank(
+            scanner, bank_generator,
+            workers=int(os.getenv('QUESTION_BANK_WORKERS', '2')),
+            requests_per_minute=float(os.getenv('QUESTION_BANK_RATE_PER_MINUTE', '20')),
+            batch_size=int(os.getenv('QUESTION_BANK_BATCH_SIZE', '8'))
+        )
+        question_bank.start()
+    else:
+        print(f"Warning: question bank disabled, provider '{bank_provider}' is not available")
+
+# Hit rates of every cache, read when /metrics is scraped
+metrics.registry.track_cache('quiz', quiz_cache)
+metrics.registry.track_cache('answer_key', answer_key_cache)
+metrics.registry.track_cache('subject_response', response_cache)
+metrics.registry.track_cache('progress_tracker', progress_registry.trackers)
+metrics.registry.track_cache('grading_key_answer', metrics.FunctionCacheStats(grading.key_answer))
+metrics.registry.track_cache('grading_stem', metrics.FunctionCacheStats(grading.stem))
+if api_response_cache is not None:
+    metrics.registry.track_cache('api_response', api_response_cache)
+metrics.registry.track_cache('scanner_topic', scanner.topic_cache)
+metrics.registry.track_cache('topic_derived', DERIVED_CACHE)
+metrics.registry.track_cache('question_pool', local_generator.pool_cache_stats)
+if question_bank is not None:
+    metrics.registry.track_cache('question_bank', question_bank.deck_stats)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 
 
+if metrics.METRICS_ENABLED:
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response):
+        start = g.get('request_start')
+        if start is not None:
+            # The route pattern, not the URL, keeps the number of series bounded
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, route, response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Request latencies, stage timings and cache hit rates in Prometheus text format."""
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     """Serve the main application page."""
@@ -40,26 +132,34 @@ def get_subjects():
     try:
         subjects = scanner.scan_subjects()
 
-        # Format response
-        formatted = []
-        for subject_name, topics in subjects.items():
-            formatted.append({
-                'name': subject_name,
-                'topics': [
-                    {
-                        'title': topic['title'],
-                        'sections_count': len(topic.get('sections', [])),
-                        'key_terms_count': len(topic.get('key_terms', [])),
-                        'word_count': topic.get('word_count', 0)
-                    }
-                    for topic in topics
-                ]
-            })
+        def build_payload():
+            # Format response
+            formatted = []
+            for subject_name, topics in subjects.items():
+                formatted.append({
+                    'name': subject_name,
+                    'topics': [
+                        {
+                            'title': topic['title'],
+                            'sections_count': topic['sections_count'],
+                            'key_terms_count': topic['key_terms_count'],
+                            'word_count': topic['word_count']
+                        }
+                        for topic in topics
+                    ]
+                })
+
+            return {
+                'success': True,
+                'subjects': formatted
+            }
 
-        return jsonify({
-            'success': True,
-            'subjects': formatted
-        })
+        return _cacheable_json(
+            ('subjects', scanner.index_version),
+            scanner.index_version,
+            scanner.index_last_modified,
+            build_payload
+        )
     except Exception as e:
         return jsonify({
             'success': False,
@@ -79,16 +179,24 @@ def get_topic(subject, topic_title):
                 'error': 'Topic not found'
             }), 404
 
-        return jsonify({
-            'success': True,
-            'topic': {
-                'title': topic_data['title'],
-                'html_content': topic_data['html_content'],
-                'sections': topic_data['sections'],
-                'key_terms': topic_data['key_terms'],
-                'quiz_questions': topic_data.get('quiz_questions', [])
+        def build_payload():
+            return {
+                'success': True,
+                'topic': {
+                    'title': topic_data['title'],
+                    'html_content': topic_data['html_content'],
+                    'sections': topic_data['sections'],
+                    'key_terms': topic_data['key_terms'],
+                    'quiz_questions': topic_data.get('quiz_questions', [])
+                }
             }
-        })
+
+        return _cacheable_json(
+            ('topic', subject, topic_title, topic_data['version']),
+            topic_data['version'],
+            scanner.get_last_modified(topic_data['file_path']),
+            build_payload
+        )
     except Exception as e:
         return jsonify({
             'success': False,
@@ -96,9 +204,40 @@ def get_topic(subject, topic_title):
         }), 500
 
 
+def _cacheable_json(cache_key, etag: str, last_modified: Optional[float], build_payload: Callable[[], Dict]):
+    """Serve a JSON payload with validators, reusing its serialized form.
+
+    Clients must revalidate, and get a bodyless 304 while ``etag`` is
+    unchanged. Otherwise the body comes from the response cache and
+    ``build_payload`` runs only on a cache miss.
+    """
+    response = app.response_class(mimetype='application/json')
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+    response.headers['Cache-Control'] = 'no-cache'
+
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    body = response_cache.get(cache_key)
+    if body is None:
+        body = app.json.dumps(build_payload())
+        response_cache.set(cache_key, body)
+    response.set_data(body)
+    return response
+
+
 @app.route('/api/questions/generate', methods=['POST'])
 def generate_questions():
-    """Generate quiz questions for a topic."""
+    """Generate quiz questions for a topic.
+
+    Passing a ``seed`` makes local generation reproducible: the response
+    carries a ``quiz_id`` (also its ETag) and identical requests are served
+    from the quiz cache. The quiz_id holds the quiz settings, so any server
+    process can rebuild the quiz from it.
+    """
     try:
         data = request.json
         subject = data.get('subject')
@@ -107,6 +246,7 @@ def generate_questions():
         count = data.get('count', 10)
         use_api = data.get('use_api', False)
         api_provider = data.get('api_provider', 'local')
+        seed = data.get('seed')
 
         # Get topic content
         topic_data = scanner.get_topic_content(subject, topic_title)
@@ -117,26 +257,42 @@ def generate_questions():
                 'error': 'Topic not found'
             }), 404
 
+        generated_with = 'local'
+
         # Generate questions based on preference
         questions = []
-
-        if use_api and api_provider in ['openai', 'anthropic']:
-            # Use API generator
-            if api_provider == 'openai' and api_generator_openai.is_available():
-                questions = api_generator_openai.generate_questions(topic_data, difficulty, count)
-            elif api_provider == 'anthropic' and api_generator_anthropic.is_available():
-                questions = api_generator_anthropic.generate_questions(topic_data, difficulty, count)
-            else:
-                # Fallback to local if API not available
-                questions = local_generator.generate_questions(topic_data, difficulty, count)
-        else:
-            # Use local generator
+        api_generator = api_generators.get(api_provider) if use_api else None
+        if question_bank is not None and api_generator is question_bank.generator:
+            questions = question_bank.get_questions(subject, topic_data, difficulty, count) or []
+        if not questions and api_generator is not None and api_generator.is_configured():
+            # Empty if the provider failed, was busy or missed the deadline
+            questions = api_generator.generate_questions(topic_data, difficulty, count,
+                                                         deadline=api_deadline_seconds)
+        if questions:
+            generated_with = api_provider
+
+        if not questions and seed is not None:
+            # Reproducible local quiz (also the fallback if the API is not available)
+            seed = str(seed)
+            quiz_id = _quiz_id(subject, topic_data, difficulty, count, seed)
+            if quiz_id in request.if_none_match:
+                return _not_modified(quiz_id)
+
+            body = quiz_cache.get(quiz_id)
+            if body is None:
+                body = _build_seeded_quiz(quiz_id, topic_data, difficulty, count, seed)
+
+            metrics.GENERATIONS.inc('questions', generated_with)
+            return _quiz_response(body, quiz_id)
+        elif not questions:
+            # Use local generator (also the fallback if the API is not available)
             questions = local_generator.generate_questions(topic_data, difficulty, count)
 
+        metrics.GENERATIONS.inc('questions', generated_with)
         return jsonify({
             'success': True,
             'questions': questions,
-            'generated_with': api_provider if use_api else 'local'
+            'generated_with': generated_with
         })
 
     except Exception as e:
@@ -146,6 +302,164 @@ def generate_questions():
         }), 500
 
 
+@app.route('/api/questions/stream', methods=['GET'])
+def stream_questions():
+    """Stream generated questions as Server-Sent Events.
+
+    Sends a ``question`` event as soon as each question is ready, then a
+    ``done`` event with the count and the generator used. Takes the same
+    settings as /api/questions/generate, as query parameters (EventSource
+    can only make GET requests).
+    """
+    subject = request.args.get('subject')
+    topic_title = request.args.get('topic')
+    difficulty = request.args.get('difficulty', 'medium')
+    count = request.args.get('count', 10, type=int)
+    use_api = request.args.get('use_api', 'false').lower() == 'true'
+    api_provider = request.args.get('api_provider', 'local')
+
+    if difficulty not in ('easy', 'medium', 'hard'):
+        return jsonify({
+            'success': False,
+            'error': 'Invalid difficulty'
+        }), 400
+
+    topic_data = scanner.get_topic_content(subject, topic_title)
+    if not topic_data:
+        return jsonify({
+            'success': False,
+            'error': 'Topic not found'
+        }), 404
+
+    api_generator = api_generators.get(api_provider) if use_api else None
+
+    def events():
+        generated_with = api_provider if use_api else 'local'
+        sent = 0
+        try:
+            questions = None
+            if question_bank is not None and api_generator is question_bank.generator:
+                questions = question_bank.get_questions(subject, topic_data, difficulty, count)
+            if questions is None and api_generator is not None and api_generator.is_configured():
+                questions = api_generator.stream_questions(topic_data, difficulty, count,
+                                                           deadline=api_deadline_seconds)
+
+            seen = set()
+            if questions is not None:
+                for question in questions:
+                    sent += 1
+                    seen.add(question.get('question'))
+                    yield _sse_event('question', question)
+
+            if sent == 0:
+                generated_with = 'local'
+            if sent < count:
+                # Local generation, also the fallback if the API sent nothing
+                # and the top-up if its stream ended or stalled early
+                for question in local_generator.iter_questions(topic_data, difficulty, count):
+                    if sent >= count:
+                        break
+                    if question.get('question') in seen:
+                        continue
+                    sent += 1
+                    yield _sse_event('question', question)
+
+            metrics.GENERATIONS.inc('questions', generated_with)
+            yield _sse_event('done', {'success': True, 'count': sent, 'generated_with': generated_with})
+        except Exception as e:
+            yield _sse_event('done', {'success': False, 'count': sent, 'error': str(e)})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/questions/<quiz_id>', methods=['GET'])
+def get_generated_quiz(quiz_id):
+    """Fetch a previously generated seeded quiz by its quiz_id."""
+    if quiz_id in request.if_none_match:
+        return _not_modified(quiz_id)
+
+    body = _seeded_quiz(quiz_id)
+    if body is None:
+        return jsonify({
+            'success': False,
+            'error': 'Quiz not found'
+        }), 404
+
+    return _quiz_response(body, quiz_id)
+
+
+def _quiz_id(subject: str, topic_data, difficulty: str, count, seed: str) -> str:
+    """Stable identifier for a seeded quiz of a specific topic version.
+
+    The quiz settings, base64-encoded, then a hash of the settings and the
+    topic version: any server process can rebuild the quiz from it, and a
+    quiz_id of an edited topic no longer matches.
+    """
+    settings = [subject, topic_data['title'], difficulty, count, seed]
+    encoded = base64.urlsafe_b64encode(json.dumps(settings).encode('utf-8')).decode('ascii').rstrip('=')
+    check = json.dumps(settings + [topic_data.get('version')])
+    return f"{encoded}.{hashlib.sha256(check.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _build_seeded_quiz(quiz_id: str, topic_data, difficulty: str, count, seed: str) -> str:
+    """Generate a seeded quiz and cache its response body and answer key."""
+    questions = local_generator.generate_questions(topic_data, difficulty, count, seed=seed)
+    body = app.json.dumps({
+        'success': True,
+        'questions': questions,
+        'generated_with': 'local',
+        'quiz_id': quiz_id
+    })
+    quiz_cache.set(quiz_id, body)
+    answer_key_cache.set(quiz_id, AnswerKey.from_questions(questions))
+    return body
+
+
+def _seeded_quiz(quiz_id: str) -> Optional[str]:
+    """The response body of a seeded quiz, rebuilt from its quiz_id if this process hasn't cached it.
+
+    None if the quiz_id is malformed or its topic is gone or has changed.
+    """
+    body = quiz_cache.get(quiz_id)
+    if body is not None:
+        return body
+    try:
+        encoded = quiz_id.split('.', 1)[0]
+        settings = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+        subject, topic_title, difficulty, count, seed = settings
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(subject, str) or not isinstance(topic_title, str):
+        return None
+
+    topic_data = scanner.get_topic_content(subject, topic_title)
+    if topic_data is None or _quiz_id(subject, topic_data, difficulty, count, seed) != quiz_id:
+        return None
+    return _build_seeded_quiz(quiz_id, topic_data, difficulty, count, seed)
+
+
+def _quiz_response(body: str, quiz_id: str):
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(quiz_id)
+    # A quiz_id pins the topic version, so the quiz never changes
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+def _not_modified(etag: str):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
 @app.route('/api/flashcards/generate', methods=['POST'])
 def generate_flashcards():
     """Generate flashcards for a topic."""
@@ -167,21 +481,25 @@ def generate_flashcards():
 
         # Generate flashcards
         flashcards = []
+        generated_with = 'local'
 
-        if use_api and api_provider in ['openai', 'anthropic']:
-            if api_provider == 'openai' and api_generator_openai.is_available():
-                flashcards = api_generator_openai.generate_flashcards(topic_data)
-            elif api_provider == 'anthropic' and api_generator_anthropic.is_available():
-                flashcards = api_generator_anthropic.generate_flashcards(topic_data)
-            else:
-                flashcards = local_generator.generate_flashcards(topic_data)
+        api_generator = api_generators.get(api_provider) if use_api else None
+        if question_bank is not None and api_generator is question_bank.generator:
+            flashcards = question_bank.get_flashcards(subject, topic_data) or []
+        if not flashcards and api_generator is not None and api_generator.is_configured():
+            # Empty if the provider failed, was busy or missed the deadline
+            flashcards = api_generator.generate_flashcards(topic_data, deadline=api_deadline_seconds)
+
+        if flashcards:
+            generated_with = api_provider
         else:
             flashcards = local_generator.generate_flashcards(topic_data)
 
+        metrics.GENERATIONS.inc('flashcards', generated_with)
         return jsonify({
             'success': True,
             'flashcards': flashcards,
-            'generated_with': api_provider if use_api else 'local'
+            'generated_with': generated_with
         })
 
     except Exception as e:
@@ -191,10 +509,39 @@ def generate_flashcards():
         }), 500
 
 
+def _student_tracker() -> Optional[ProgressTracker]:
+    """The progress tracker for the student making the request.
+
+    The student is named by the ``X-Student-Id`` header, a ``student_id``
+    query parameter or a ``student_id`` field in the JSON body; requests
+    without one use the default student. Returns None for a malformed id.
+    """
+    student_id = (
+        request.headers.get('X-Student-Id')
+        or request.args.get('student_id')
+        or (request.get_json(silent=True) or {}).get('student_id')
+        or DEFAULT_STUDENT
+    )
+    if not progress_registry.is_valid_student_id(str(student_id)):
+        return None
+    return progress_registry.get(str(student_id))
+
+
+def _invalid_student():
+    return jsonify({
+        'success': False,
+        'error': 'Invalid student_id'
+    }), 400
+
+
 @app.route('/api/progress/quiz', methods=['POST'])
 def record_quiz_progress():
     """Record quiz completion and results."""
     try:
+        tracker = _student_tracker()
+        if tracker is None:
+            return _invalid_student()
+
         data = request.json
         subject = data.get('subject')
         topic = data.get('topic')
@@ -202,9 +549,17 @@ def record_quiz_progress():
         questions = data.get('questions')
         answers = data.get('answers')
         time_taken = data.get('time_taken_seconds', 0)
-
-        result = progress_tracker.record_quiz(
-            subject, topic, difficulty, questions, answers, time_taken
+        # Seeded quizzes have their answer key cached under their quiz_id
+        quiz_id = data.get('quiz_id')
+        answer_key = answer_key_cache.get(quiz_id) if quiz_id else None
+        if answer_key is None and isinstance(quiz_id, str):
+            # Generated by another server process (or evicted): rebuilt here
+            body = _seeded_quiz(quiz_id)
+            if body is not None:
+                answer_key = answer_key_cache.get(quiz_id) or AnswerKey.from_questions(json.loads(body)['questions'])
+
+        result = tracker.record_quiz(
+            subject, topic, difficulty, questions, answers, time_taken, answer_key=answer_key
         )
 
         return jsonify({
@@ -223,13 +578,17 @@ def record_quiz_progress():
 def record_flashcard_progress():
     """Record flashcard study session."""
     try:
+        tracker = _student_tracker()
+        if tracker is None:
+            return _invalid_student()
+
         data = request.json
         subject = data.get('subject')
         topic = data.get('topic')
         cards_reviewed = data.get('cards_reviewed')
         time_taken = data.get('time_taken_seconds', 0)
 
-        result = progress_tracker.record_flashcard_session(
+        result = tracker.record_flashcard_session(
             subject, topic, cards_reviewed, time_taken
         )
 
@@ -249,9 +608,13 @@ def record_flashcard_progress():
 def get_progress_stats():
     """Get overall progress statistics."""
     try:
-        overall = progress_tracker.get_overall_stats()
-        recent_quizzes = progress_tracker.get_recent_quizzes(limit=5)
-        strengths_weaknesses = progress_tracker.get_strengths_and_weaknesses()
+        tracker = _student_tracker()
+        if tracker is None:
+            return _invalid_student()
+
+        overall = tracker.get_overall_stats()
+        recent_quizzes = tracker.get_recent_quizzes(limit=5)
+        strengths_weaknesses = tracker.get_strengths_and_weaknesses()
 
         return jsonify({
             'success': True,
@@ -271,8 +634,12 @@ def get_progress_stats():
 def get_topic_progress(subject, topic):
     """Get progress for a specific topic."""
     try:
-        stats = progress_tracker.get_topic_stats(subject, topic)
-        history = progress_tracker.get_quiz_history_by_topic(subject, topic)
+        tracker = _student_tracker()
+        if tracker is None:
+            return _invalid_student()
+
+        stats = tracker.get_topic_stats(subject, topic)
+        history = tracker.get_quiz_history_by_topic(subject, topic)
 
         return jsonify({
             'success': True,
@@ -293,9 +660,16 @@ def get_api_status():
     return jsonify({
         'success': True,
         'api_status': {
-            'openai': api_generator_openai.is_available(),
-            'anthropic': api_generator_anthropic.is_available()
-        }
+            'openai': api_generators['openai'].is_available(),
+            'anthropic': api_generators['anthropic'].is_available()
+        },
+        # Circuit state, failures and latency percentiles of each provider
+        'provider_health': {
+            provider: generator.health.status()
+            for provider, generator in api_generators.items()
+            if generator.client is not None
+        },
+        'question_bank': question_bank.status() if question_bank is not None else None
     })
 
 
@@ -1,48 +1,223 @@
 import os
-from typing import List, Dict, Optional
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Iterator, List, Dict, Optional
 import json
 
-class APIQuestionGenerator:
-    """Generates questions using AI APIs (OpenAI or Anthropic)."""
+from .content_chunker import estimate_tokens, select_chunks
+from .json_stream import JSONArrayParser
+from .metrics import record_stage
+from .provider_health import ProviderHealth
+from .response_cache import ResponseCache
+
+DEFAULT_MODELS = {
+    'openai': 'gpt-4o-mini',  # Using mini for cost efficiency
+    'anthropic': 'claude-3-5-haiku-20241022',  # Using Haiku for cost efficiency
+    'stub': 'stub'
+}
+
+QUESTIONS_SYSTEM_PROMPT = "You are an expert educational content creator who generates high-quality quiz questions for students."
+FLASHCARDS_SYSTEM_PROMPT = "You are an expert at creating educational flashcards."
+
+BATCH_SYSTEM_PROMPT = "You are an expert educational content creator who generates high-quality quiz questions and flashcards for students."
+
+DIFFICULTY_DESCRIPTIONS = {
+    'easy': 'Easy questions focusing on definitions, basic facts, and simple recall.',
+    'medium': 'Medium difficulty questions requiring understanding and application of concepts.',
+    'hard': 'Challenging questions requiring analysis, synthesis, and deeper understanding.'
+}
+
+QUESTION_FORMAT = """[
+    {{
+        "question": "The question text",
+        "answer": "The expected answer",
+        "type": "multiple_choice|short_answer|true_false",
+        "options": ["option1", "option2", "option3", "option4"],
+        "difficulty": "{difficulty}",
+        "explanation": "Brief explanation of the answer"
+    }}
+]"""
+
+FLASHCARD_FORMAT = """[
+    {
+        "front": "Term, concept, or question",
+        "back": "Definition, explanation, or answer",
+        "category": "vocabulary|concept|fact"
+    }
+]"""
+
+TEMPERATURE = 0.7
+MAX_TOKENS = 2000
+
+# Limits of one batched request (generate_batch): estimated prompt tokens,
+# and response tokens, which must fit the model's output limit
+BATCH_PROMPT_TOKENS = int(os.getenv('API_BATCH_PROMPT_TOKENS', '6000'))
+BATCH_MAX_TOKENS = int(os.getenv('API_BATCH_MAX_TOKENS', '8000'))
+# Rough response size of one generated item, for packing batches
+QUESTION_TOKENS = 90
+FLASHCARD_TOKENS = 45
+
+# Marks the end of a stream read on the thread pool
+_STREAM_END = object()
+
+# Seconds the HTTP client waits for a provider before giving up
+API_TIMEOUT_SECONDS = float(os.getenv('API_TIMEOUT_SECONDS', '30'))
+# Estimated tokens of topic content included in a prompt
+API_PROMPT_TOKENS = int(os.getenv('API_PROMPT_TOKENS', '600'))
+# Calls to one provider that may be running at once
+API_MAX_IN_FLIGHT = int(os.getenv('API_MAX_IN_FLIGHT', '4'))
+# Seconds an idle pooled connection to a provider is kept open
+API_KEEPALIVE_SECONDS = float(os.getenv('API_KEEPALIVE_SECONDS', '60'))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+API_BREAKER_FAILURES = int(os.getenv('API_BREAKER_FAILURES', '3'))
+API_BREAKER_RESET_SECONDS = float(os.getenv('API_BREAKER_RESET_SECONDS', '30'))
 
-    def __init__(self, api_key: Optional[str] = None, provider: str = 'openai'):
+
+class ProviderUnavailableError(Exception):
+    """The provider's circuit is open, so the call was not made."""
+
+
+class APIQuestionGenerator:
+    """Generates questions using AI APIs (OpenAI or Anthropic).
+
+    With a ``response_cache``, responses are stored under a hash of the
+    provider, model, prompts and sampling settings, so identical requests
+    are answered from the cache without calling the API. The ``'stub'``
+    provider answers locally with placeholder questions and needs no key;
+    it exists to exercise the cache and the API code paths offline.
+
+    Passing a ``deadline`` runs the call on a small thread pool and gives
+    up waiting after that many seconds, returning [] so the caller can fall
+    back to local generation. At most ``max_in_flight`` calls run against
+    the provider at once; further deadline calls are turned away at once
+    rather than queued. A call that misses its deadline keeps running and
+    still fills the response cache for the next request.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, provider: str = 'openai',
+                 model: Optional[str] = None, response_cache: Optional[ResponseCache] = None,
+                 max_in_flight: int = API_MAX_IN_FLIGHT, timeout_seconds: float = API_TIMEOUT_SECONDS):
         """
         Initialize the API question generator.
 
         Args:
             api_key: API key for the service (or set via environment variable)
-            provider: 'openai' or 'anthropic'
+            provider: 'openai', 'anthropic' or 'stub'
+            model: Model name (defaults to the provider's entry in DEFAULT_MODELS)
+            response_cache: Cache for generated questions and flashcards
+            max_in_flight: Concurrent calls allowed to the provider
+            timeout_seconds: HTTP timeout of the provider client
         """
         self.provider = provider
+        self.model = model or DEFAULT_MODELS.get(provider)
+        self.response_cache = response_cache
         self.api_key = api_key or os.getenv(
             'OPENAI_API_KEY' if provider == 'openai' else 'ANTHROPIC_API_KEY'
         )
         self.client = None
-
-        if self.api_key:
+        # Requests that reached the provider (cache misses)
+        self.api_calls = 0
+        self._api_calls_lock = threading.Lock()
+        self.timeout_seconds = timeout_seconds
+        self.max_in_flight = max_in_flight
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.health = ProviderHealth(API_BREAKER_FAILURES, API_BREAKER_RESET_SECONDS)
+
+        if provider == 'stub':
+            self.api_key = 'stub'
+            self.client = _StubClient(latency_seconds=float(os.getenv('API_STUB_LATENCY_SECONDS', '0')))
+        elif self.api_key:
             self._initialize_client()
 
     def _initialize_client(self):
-        """Initialize the appropriate API client."""
+        """Initialize the appropriate API client.
+
+        The client gets its own pooled HTTP connection pool, sized for
+        max_in_flight calls and kept alive between requests, so calls after
+        the first skip the TCP and TLS handshakes.
+        """
         try:
+            import httpx
+            http_client = httpx.Client(
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=self.max_in_flight * 2,
+                    max_keepalive_connections=self.max_in_flight,
+                    keepalive_expiry=API_KEEPALIVE_SECONDS
+                )
+            )
             if self.provider == 'openai':
                 import openai
-                self.client = openai.OpenAI(api_key=self.api_key)
+                self.client = openai.OpenAI(api_key=self.api_key, timeout=self.timeout_seconds, max_retries=1,
+                                            http_client=http_client)
             elif self.provider == 'anthropic':
                 import anthropic
-                self.client = anthropic.Anthropic(api_key=self.api_key)
+                self.client = anthropic.Anthropic(api_key=self.api_key, timeout=self.timeout_seconds, max_retries=1,
+                                                  http_client=http_client)
         except ImportError:
             print(f"Warning: {self.provider} library not installed. Install with: pip install {self.provider}")
         except Exception as e:
             print(f"Error initializing {self.provider} client: {e}")
 
-    def is_available(self) -> bool:
-        """Check if API is available and configured."""
+    def is_configured(self) -> bool:
+        """Check if API is configured, whatever the state of its circuit breaker.
+
+        Cached responses are served even while the circuit is open.
+        """
         return self.client is not None and self.api_key is not None
 
-    def generate_questions(self, topic_data: Dict, difficulty: str = 'medium', count: int = 10) -> List[Dict]:
-        """Generate questions using AI API."""
-        if not self.is_available():
+    def is_available(self) -> bool:
+        """Check if API is configured and its circuit breaker lets calls through."""
+        return self.is_configured() and self.health.available()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight, thread_name_prefix=f'{self.provider}-api'
+                )
+            return self._executor
+
+    def _run_with_deadline(self, deadline: Optional[float], generate: Callable[..., List[Dict]], *args) -> List[Dict]:
+        """Run ``generate`` on the provider's thread pool, waiting at most ``deadline`` seconds."""
+        if deadline is None:
+            return generate(*args)
+
+        if not self._in_flight.acquire(blocking=False):
+            print(f"{self.provider}: {self.max_in_flight} calls already in flight, not waiting for another")
+            return []
+
+        try:
+            future = self._get_executor().submit(generate, *args)
+        except Exception:
+            self._in_flight.release()
+            raise
+        # The slot is freed when the call ends, not when the caller stops waiting
+        future.add_done_callback(lambda _: self._in_flight.release())
+
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeoutError:
+            print(f"{self.provider} did not answer within {deadline}s")
+            return []
+        except Exception as e:
+            print(f"Error generating with {self.provider}: {e}")
+            return []
+
+    def generate_questions(self, topic_data: Dict, difficulty: str = 'medium', count: int = 10,
+                           deadline: Optional[float] = None) -> List[Dict]:
+        """Generate questions using AI API.
+
+        With a ``deadline`` (seconds), returns [] if the provider is busy or
+        too slow. A cached response is returned even while the provider's
+        circuit is open.
+        """
+        if not self.is_configured():
             print("API not available. Please configure API key.")
             return []
 
@@ -51,68 +226,289 @@ class APIQuestionGenerator:
         prompt = self._create_prompt(content_summary, difficulty, count)
 
         try:
-            if self.provider == 'openai':
-                return self._generate_with_openai(prompt)
-            elif self.provider == 'anthropic':
-                return self._generate_with_anthropic(prompt)
+            return self._cache_then_generate(deadline, QUESTIONS_SYSTEM_PROMPT, prompt)
         except Exception as e:
             print(f"Error generating questions with {self.provider}: {e}")
             return []
 
+    def stream_questions(self, topic_data: Dict, difficulty: str = 'medium', count: int = 10,
+                         deadline: Optional[float] = None) -> Iterator[Dict]:
+        """Yield questions one by one as the provider streams its answer.
+
+        Yields nothing if the provider is unavailable, busy (max_in_flight
+        calls already running) or fails before the first question; a cached
+        response is yielded even while the circuit is open. With a
+        ``deadline`` (seconds), the stream stops early if the next question
+        does not arrive in time. The questions are cached only when the
+        response arrived complete.
+        """
+        if not self.is_configured():
+            return
+
+        content_summary = self._prepare_content_summary(topic_data)
+        prompt = self._create_prompt(content_summary, difficulty, count)
+        yield from self._stream_generate(QUESTIONS_SYSTEM_PROMPT, prompt, deadline)
+
+    def _stream_generate(self, system_prompt: str, prompt: str, deadline: Optional[float] = None) -> Iterator[Dict]:
+        key = None
+        if self.response_cache is not None:
+            key = self.cache_key(system_prompt, prompt)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                yield from cached
+                return
+
+        if not self.health.available():
+            return
+
+        if not self._in_flight.acquire(blocking=False):
+            print(f"{self.provider}: {self.max_in_flight} calls already in flight, not streaming another")
+            return
+
+        if deadline is None:
+            try:
+                yield from self._parse_stream(system_prompt, prompt, key)
+            finally:
+                # Also runs when the consumer stops early (client disconnected)
+                self._in_flight.release()
+            return
+
+        # The stream is read on the provider's thread pool, so the wait for
+        # each question can be cut short. A stream that misses the deadline
+        # runs on and its questions are still cached.
+        arrived = queue.Queue()
+
+        def pump():
+            try:
+                for item in self._parse_stream(system_prompt, prompt, key):
+                    arrived.put(item)
+            finally:
+                arrived.put(_STREAM_END)
+
+        try:
+            future = self._get_executor().submit(pump)
+        except Exception:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+
+        while True:
+            try:
+                item = arrived.get(timeout=deadline)
+            except queue.Empty:
+                print(f"{self.provider} sent no question within {deadline}s")
+                return
+            if item is _STREAM_END:
+                return
+            yield item
+
+    def _parse_stream(self, system_prompt: str, prompt: str, key: Optional[str]) -> Iterator[Dict]:
+        """Yield the items of a streamed response, caching them if the response is complete."""
+        parser = JSONArrayParser()
+        items = []
+        try:
+            for text in self._complete_stream(system_prompt, prompt):
+                for item in parser.feed(text):
+                    items.append(item)
+                    yield item
+        except Exception as e:
+            print(f"Error streaming from {self.provider}: {e}")
+
+        if items and parser.done and key is not None:
+            self.response_cache.set(key, items)
+
+    def _complete_stream(self, system_prompt: str, prompt: str, max_tokens: int = MAX_TOKENS) -> Iterator[str]:
+        """Send one prompt to the provider and yield the response text as it arrives.
+
+        Like _complete, goes through the circuit breaker; the latency
+        recorded is that of the whole stream.
+        """
+        if not self.health.allow():
+            raise ProviderUnavailableError(f"{self.provider} is failing, not calling it for now")
+        with self._api_calls_lock:
+            self.api_calls += 1
+        start = time.perf_counter()
+        try:
+            yield from self._request_stream(system_prompt, prompt, max_tokens)
+        except GeneratorExit:
+            # The consumer stopped reading; says nothing about the provider
+            raise
+        except Exception as e:
+            self.health.record_failure(e)
+            raise
+        finally:
+            record_stage(f'generate_{self.provider}', time.perf_counter() - start)
+        self.health.record_success(time.perf_counter() - start)
+
+    def _request_stream(self, system_prompt: str, prompt: str, max_tokens: int) -> Iterator[str]:
+        if self.provider == 'openai':
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        elif self.provider == 'anthropic':
+            with self.client.messages.stream(
+                model=self.model,
+                max_tokens=max_tokens,
+                temperature=TEMPERATURE,
+                system=system_prompt,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            ) as stream:
+                yield from stream.text_stream
+
+        elif self.provider == 'stub':
+            yield from self.client.stream(prompt)
+
+        else:
+            raise ValueError(f"Unknown provider: {self.provider}")
+
+    def cache_key(self, system_prompt: str, prompt: str) -> str:
+        """Content address of a response: everything that determines it."""
+        return ResponseCache.make_key(self.provider, self.model, system_prompt, prompt, TEMPERATURE, MAX_TOKENS)
+
+    def _cache_then_generate(self, deadline: Optional[float], system_prompt: str, prompt: str) -> List[Dict]:
+        """Answer from the cache, else call the provider if its circuit is closed."""
+        key = None
+        if self.response_cache is not None:
+            key = self.cache_key(system_prompt, prompt)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+
+        if not self.health.available():
+            return []
+        return self._run_with_deadline(deadline, self._generate, system_prompt, prompt, key)
+
+    def _cached_generate(self, system_prompt: str, prompt: str) -> List[Dict]:
+        """Parsed JSON list for a prompt, from the cache or the provider.
+
+        Only non-empty results are cached, so a failed or unparsable
+        response is retried on the next request.
+        """
+        key = None
+        if self.response_cache is not None:
+            key = self.cache_key(system_prompt, prompt)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+
+        return self._generate(system_prompt, prompt, key)
+
+    def _generate(self, system_prompt: str, prompt: str, key: Optional[str]) -> List[Dict]:
+        """Call the provider and cache the parsed result under ``key``."""
+        text = self._complete(system_prompt, prompt)
+        try:
+            result = json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON from {self.provider} response: {e}")
+            # Try to extract JSON from the response
+            result = self._extract_json_from_text(text)
+
+        if result and key is not None:
+            self.response_cache.set(key, result)
+        return result
+
+    def _complete(self, system_prompt: str, prompt: str, max_tokens: int = MAX_TOKENS) -> str:
+        """Send one prompt to the provider and return the response text.
+
+        Raises ProviderUnavailableError without calling the provider while
+        its circuit is open; every call's outcome and latency is recorded
+        in ``self.health``.
+        """
+        if not self.health.allow():
+            raise ProviderUnavailableError(f"{self.provider} is failing, not calling it for now")
+        with self._api_calls_lock:
+            self.api_calls += 1
+        start = time.perf_counter()
+        try:
+            text = self._request(system_prompt, prompt, max_tokens)
+        except Exception as e:
+            self.health.record_failure(e)
+            raise
+        finally:
+            record_stage(f'generate_{self.provider}', time.perf_counter() - start)
+        self.health.record_success(time.perf_counter() - start)
+        return text
+
+    def _request(self, system_prompt: str, prompt: str, max_tokens: int) -> str:
+        if self.provider == 'openai':
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=max_tokens
+            )
+            return response.choices[0].message.content
+
+        elif self.provider == 'anthropic':
+            response = self.client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens,
+                temperature=TEMPERATURE,
+                system=system_prompt,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            return response.content[0].text
+
+        elif self.provider == 'stub':
+            return self.client.complete(prompt)
+
+        raise ValueError(f"Unknown provider: {self.provider}")
+
     def _prepare_content_summary(self, topic_data: Dict) -> str:
-        """Prepare a summary of the content for the AI."""
+        """Prepare a summary of the content for the AI.
+
+        Lists every section title, then the chunks of the topic that cover
+        the most key terms within API_PROMPT_TOKENS (see content_chunker).
+        """
         summary_parts = []
 
         # Add title
         summary_parts.append(f"Topic: {topic_data.get('title', 'Unknown')}")
 
-        # Add key sections
+        # Add the outline of the whole topic
         if topic_data.get('sections'):
-            summary_parts.append("\nKey Sections:")
-            for section in topic_data['sections'][:5]:  # Limit to avoid token limits
+            summary_parts.append("\nSections:")
+            for section in topic_data['sections']:
                 summary_parts.append(f"- {section['title']}")
 
-        # Add key terms
-        if topic_data.get('key_terms'):
-            summary_parts.append("\nKey Terms:")
-            for term in topic_data['key_terms'][:10]:
-                summary_parts.append(f"- {term['term']}: {term['definition'][:100]}")
-
-        # Add a portion of the actual content
-        if topic_data.get('content'):
-            content = topic_data['content']
-            # Take first 1000 characters or less
-            content_excerpt = content[:1500] if len(content) > 1500 else content
-            summary_parts.append(f"\nContent Excerpt:\n{content_excerpt}")
+        # Add the most informative parts of the content
+        chunks = select_chunks(topic_data, API_PROMPT_TOKENS)
+        if chunks:
+            summary_parts.append("\nContent Excerpts:")
+            for chunk in chunks:
+                summary_parts.append(f"\n[{chunk.heading}]\n{chunk.text}")
 
         return "\n".join(summary_parts)
 
     def _create_prompt(self, content: str, difficulty: str, count: int) -> str:
         """Create the prompt for the AI."""
-        difficulty_descriptions = {
-            'easy': 'Easy questions focusing on definitions, basic facts, and simple recall.',
-            'medium': 'Medium difficulty questions requiring understanding and application of concepts.',
-            'hard': 'Challenging questions requiring analysis, synthesis, and deeper understanding.'
-        }
-
         prompt = f"""Based on the following study material, generate {count} {difficulty} level quiz questions.
 
-{difficulty_descriptions[difficulty]}
+{DIFFICULTY_DESCRIPTIONS[difficulty]}
 
 Study Material:
 {content}
 
 Generate questions in the following JSON format:
-[
-    {{
-        "question": "The question text",
-        "answer": "The expected answer",
-        "type": "multiple_choice|short_answer|true_false",
-        "options": ["option1", "option2", "option3", "option4"],
-        "difficulty": "{difficulty}",
-        "explanation": "Brief explanation of the answer"
-    }}
-]
+{QUESTION_FORMAT.format(difficulty=difficulty)}
 
 For multiple choice questions, include 4 options with the correct answer as one of them.
 For short answer questions, provide a concise expected answer.
@@ -122,62 +518,10 @@ Return ONLY the JSON array, no additional text."""
 
         return prompt
 
-    def _generate_with_openai(self, prompt: str) -> List[Dict]:
-        """Generate questions using OpenAI API."""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",  # Using mini for cost efficiency
-                messages=[
-                    {"role": "system", "content": "You are an expert educational content creator who generates high-quality quiz questions for students."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
-
-            content = response.choices[0].message.content
-            # Parse JSON response
-            questions = json.loads(content)
-            return questions
-
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON from OpenAI response: {e}")
-            # Try to extract JSON from the response
-            return self._extract_json_from_text(content)
-        except Exception as e:
-            print(f"Error with OpenAI API: {e}")
-            return []
-
-    def _generate_with_anthropic(self, prompt: str) -> List[Dict]:
-        """Generate questions using Anthropic Claude API."""
-        try:
-            response = self.client.messages.create(
-                model="claude-3-5-haiku-20241022",  # Using Haiku for cost efficiency
-                max_tokens=2000,
-                temperature=0.7,
-                system="You are an expert educational content creator who generates high-quality quiz questions for students.",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-
-            content = response.content[0].text
-            # Parse JSON response
-            questions = json.loads(content)
-            return questions
-
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON from Claude response: {e}")
-            return self._extract_json_from_text(content)
-        except Exception as e:
-            print(f"Error with Anthropic API: {e}")
-            return []
-
     def _extract_json_from_text(self, text: str) -> List[Dict]:
         """Try to extract JSON array from text that might have extra content."""
         try:
             # Find JSON array in text
-            import re
             json_match = re.search(r'\[.*\]', text, re.DOTALL)
             if json_match:
                 return json.loads(json_match.group(0))
@@ -185,75 +529,323 @@ Return ONLY the JSON array, no additional text."""
             pass
         return []
 
-    def generate_flashcards(self, topic_data: Dict, count: int = 15) -> List[Dict]:
-        """Generate flashcards using AI API."""
-        if not self.is_available():
+    def generate_flashcards(self, topic_data: Dict, count: int = 15, deadline: Optional[float] = None) -> List[Dict]:
+        """Generate flashcards using AI API (``deadline`` and cache as in generate_questions)."""
+        if not self.is_configured():
             return []
 
         content_summary = self._prepare_content_summary(topic_data)
 
-        prompt = f"""Based on the following study material, generate {count} flashcards.
+        prompt = self._create_flashcards_prompt(content_summary, count)
+
+        try:
+            return self._cache_then_generate(deadline, FLASHCARDS_SYSTEM_PROMPT, prompt)
+        except Exception as e:
+            print(f"Error generating flashcards: {e}")
+            return []
+
+    def _create_flashcards_prompt(self, content: str, count: int) -> str:
+        return f"""Based on the following study material, generate {count} flashcards.
 
 Study Material:
-{content_summary}
+{content}
 
 Generate flashcards in the following JSON format:
-[
-    {{
-        "front": "Term, concept, or question",
-        "back": "Definition, explanation, or answer",
-        "category": "vocabulary|concept|fact"
-    }}
-]
+{FLASHCARD_FORMAT}
 
 Focus on key terms, important concepts, and critical facts.
 Return ONLY the JSON array, no additional text."""
 
-        try:
-            if self.provider == 'openai':
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "You are an expert at creating educational flashcards."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    max_tokens=2000
-                )
-                content = response.choices[0].message.content
+    def generate_batch(self, jobs: List[Dict], throttle: Optional[Callable[[], bool]] = None) -> List[List[Dict]]:
+        """Run many generation jobs in as few provider calls as the batch limits allow.
+
+        A job is a dict with ``topic_data``, ``kind`` ('questions' or
+        'flashcards'), ``count`` and, for questions, ``difficulty``. Returns
+        one list per job, in order. Jobs of the same topic share one copy of
+        its study material in the prompt. Every result is cached under the
+        same key as the equivalent single call, so later generate_questions
+        and generate_flashcards calls are cache hits; jobs already cached
+        are not sent at all, and are answered even while the provider's
+        circuit is open. A job the combined response leaves out is retried
+        as a single call.
+
+        ``throttle`` is called before every provider call (e.g. a rate
+        limiter); when it returns False the remaining jobs are left empty.
+        """
+        results: List[List[Dict]] = [[] for _ in jobs]
+        if not self.is_configured():
+            return results
+
+        # Single-call prompts: the demultiplexed results are cached under these
+        pending = []
+        summaries: Dict[int, str] = {}
+        for i, job in enumerate(jobs):
+            topic_key = id(job['topic_data'])
+            if topic_key not in summaries:
+                summaries[topic_key] = self._prepare_content_summary(job['topic_data'])
+            summary = summaries[topic_key]
+            if job['kind'] == 'flashcards':
+                system_prompt, prompt = FLASHCARDS_SYSTEM_PROMPT, self._create_flashcards_prompt(summary, job['count'])
+            else:
+                system_prompt, prompt = QUESTIONS_SYSTEM_PROMPT, self._create_prompt(summary, job['difficulty'], job['count'])
+            key = self.cache_key(system_prompt, prompt)
+            cached = self.response_cache.get(key) if self.response_cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append((i, summary, system_prompt, prompt, key))
+
+        if pending and not self.health.available():
+            return results
+
+        for batch in self._pack_batch(jobs, pending):
+            if throttle is not None and not throttle():
+                return results
+
+            if len(batch) == 1:
+                i, _, system_prompt, prompt, _ = batch[0]
+                try:
+                    results[i] = self._cached_generate(system_prompt, prompt)
+                except Exception as e:
+                    print(f"Error generating {jobs[i]['kind']} with {self.provider}: {e}")
+                continue
+
+            try:
+                text = self._complete(BATCH_SYSTEM_PROMPT, self._create_batch_prompt(jobs, batch), BATCH_MAX_TOKENS)
+                by_task = self._parse_batch_response(text)
+            except Exception as e:
+                print(f"Error generating batch with {self.provider}: {e}")
+                by_task = {}
+
+            missing = []
+            for task, (i, _, system_prompt, prompt, key) in enumerate(batch, 1):
+                items = by_task.get(str(task))
+                if isinstance(items, list) and items:
+                    results[i] = items
+                    if self.response_cache is not None:
+                        self.response_cache.set(key, items)
+                else:
+                    missing.append((i, system_prompt, prompt))
+
+            # Left out or malformed: ask for these jobs on their own
+            for i, system_prompt, prompt in missing:
+                if throttle is not None and not throttle():
+                    return results
+                try:
+                    results[i] = self._cached_generate(system_prompt, prompt)
+                except Exception as e:
+                    print(f"Error generating {jobs[i]['kind']} with {self.provider}: {e}")
+
+        return results
+
+    def _pack_batch(self, jobs: List[Dict], pending: List[tuple]) -> List[List[tuple]]:
+        """Split pending jobs into batches within BATCH_PROMPT_TOKENS and BATCH_MAX_TOKENS.
+
+        Jobs are taken in order, so the jobs of one topic stay together and
+        its study material is sent once per batch.
+        """
+        batches = []
+        batch, materials, prompt_tokens, output_tokens = [], set(), 0, 0
+        for entry in pending:
+            job = jobs[entry[0]]
+            summary = entry[1]
+            job_output = job['count'] * (FLASHCARD_TOKENS if job['kind'] == 'flashcards' else QUESTION_TOKENS)
+            job_prompt = 40 + (0 if summary in materials else estimate_tokens(summary))
+            if batch and (prompt_tokens + job_prompt > BATCH_PROMPT_TOKENS
+                          or output_tokens + job_output > BATCH_MAX_TOKENS):
+                batches.append(batch)
+                batch, materials, prompt_tokens, output_tokens = [], set(), 0, 0
+                job_prompt = 40 + estimate_tokens(summary)
+            batch.append(entry)
+            materials.add(summary)
+            prompt_tokens += job_prompt
+            output_tokens += job_output
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _create_batch_prompt(self, jobs: List[Dict], batch: List[tuple]) -> str:
+        """One prompt for several jobs: each study material once, then numbered tasks."""
+        labels: Dict[str, str] = {}
+        materials = []
+        tasks = []
+        for task, (i, summary, _, _, _) in enumerate(batch, 1):
+            if summary not in labels:
+                labels[summary] = f"M{len(labels) + 1}"
+                materials.append(f"Study Material {labels[summary]}:\n{summary}")
+            job = jobs[i]
+            if job['kind'] == 'flashcards':
+                what = f"{job['count']} flashcards. Focus on key terms, important concepts, and critical facts."
+            else:
+                difficulty = job['difficulty']
+                what = f"{job['count']} {difficulty} level quiz questions. {DIFFICULTY_DESCRIPTIONS[difficulty]}"
+            tasks.append(f"Task {task} (Study Material {labels[summary]}): generate {what}")
+
+        materials_text = "\n\n".join(materials)
+        tasks_text = "\n".join(tasks)
+        return f"""Complete every task below. Each task is based only on the study material it names.
+
+{materials_text}
+
+Tasks:
+{tasks_text}
+
+Quiz questions use the following JSON format (with the task's difficulty):
+{QUESTION_FORMAT.format(difficulty="easy|medium|hard")}
 
-            elif self.provider == 'anthropic':
-                response = self.client.messages.create(
-                    model="claude-3-5-haiku-20241022",
-                    max_tokens=2000,
-                    temperature=0.7,
-                    system="You are an expert at creating educational flashcards.",
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                content = response.content[0].text
+For multiple choice questions, include 4 options with the correct answer as one of them.
+For short answer questions, provide a concise expected answer.
+Mix different question types for variety.
 
-            flashcards = json.loads(content)
-            return flashcards
+Flashcards use the following JSON format:
+{FLASHCARD_FORMAT}
 
-        except Exception as e:
-            print(f"Error generating flashcards: {e}")
-            return []
+Return ONLY a JSON object mapping each task number to its JSON array, like {{"1": [...], "2": [...]}}, no additional text."""
+
+    def _parse_batch_response(self, text: str) -> Dict:
+        try:
+            result = json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON from {self.provider} batch response: {e}")
+            json_match = re.search(r'\{.*\}', text, re.DOTALL)
+            try:
+                result = json.loads(json_match.group(0)) if json_match else {}
+            except json.JSONDecodeError:
+                result = {}
+        return result if isinstance(result, dict) else {}
+
+
+class _StubClient:
+    """Offline stand-in for an API client.
+
+    Answers a prompt with the number of placeholder questions or
+    flashcards it asks for, the same for the same prompt every time.
+    ``latency_seconds`` simulates a slow provider.
+    """
+
+    def __init__(self, latency_seconds: float = 0):
+        self.latency_seconds = latency_seconds
+
+    def complete(self, prompt: str) -> str:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._respond(prompt)
+
+    def stream(self, prompt: str, piece_size: int = 16) -> Iterator[str]:
+        """The same response in small pieces, spread over ``latency_seconds``."""
+        text = self._respond(prompt)
+        pieces = [text[i:i + piece_size] for i in range(0, len(text), piece_size)]
+        for piece in pieces:
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds / len(pieces))
+            yield piece
+
+    def _respond(self, prompt: str) -> str:
+        tasks = re.findall(r'Task (\d+) \(Study Material (\w+)\): generate (\d+) (\w+)', prompt)
+        if tasks:
+            topics = dict(re.findall(r'Study Material (\w+):\nTopic: (.*)', prompt))
+            return json.dumps({
+                task: self._items(int(count), topics.get(material, 'the topic'),
+                                  None if kind == 'flashcards' else kind)
+                for task, material, count, kind in tasks
+            })
+
+        match = re.search(r'generate (\d+)', prompt)
+        count = int(match.group(1)) if match else 5
+        topic = re.search(r'Topic: (.*)', prompt)
+        topic = topic.group(1) if topic else 'the topic'
+
+        if 'flashcards' in prompt:
+            return json.dumps(self._items(count, topic, None))
+        difficulty = re.search(r'"difficulty": "(\w+)"', prompt)
+        return json.dumps(self._items(count, topic, difficulty.group(1) if difficulty else 'medium'))
+
+    def _items(self, count: int, topic: str, difficulty: Optional[str]) -> List[Dict]:
+        """Placeholder questions, or flashcards when there is no difficulty."""
+        if difficulty is None:
+            return [
+                {'front': f"{topic}: term {i + 1}", 'back': f"Definition {i + 1}", 'category': 'vocabulary'}
+                for i in range(count)
+            ]
+        return [
+            {
+                'question': f"Question {i + 1} about {topic}?",
+                'answer': f"Answer {i + 1}",
+                'type': 'short_answer',
+                'options': [],
+                'difficulty': difficulty,
+                'explanation': 'Generated by the offline stub provider.'
+            }
+            for i in range(count)
+        ]
 
 
 if __name__ == "__main__":
-    # Test (requires API key)
-    generator = APIQuestionGenerator(provider='openai')
-
-    if generator.is_available():
-        sample_data = {
-            'title': 'Ancient Mesopotamia',
-            'key_terms': [
-                {'term': 'Mesopotamia', 'definition': 'Land between two rivers'}
-            ],
-            'content': 'Mesopotamia was the cradle of civilization...'
-        }
+    # Test (requires API key; falls back to the offline stub provider)
+    # Run from study-guide-app/: python -m services.api_question_generator
+    import tempfile
+
+    sample_data = {
+        'title': 'Ancient Mesopotamia',
+        'key_terms': [
+            {'term': 'Mesopotamia', 'definition': 'Land between two rivers'}
+        ],
+        'content': 'Mesopotamia was the cradle of civilization...'
+    }
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResponseCache(cache_dir)
+        generator = APIQuestionGenerator(provider='openai', response_cache=cache)
+        if not generator.is_available():
+            print("API not configured. Set OPENAI_API_KEY or ANTHROPIC_API_KEY environment variable.")
+            print("Using the offline stub provider.")
+            generator = APIQuestionGenerator(provider='stub', response_cache=cache)
 
         questions = generator.generate_questions(sample_data, difficulty='easy', count=3)
         print("Generated questions:", json.dumps(questions, indent=2))
-    else:
-        print("API not configured. Set OPENAI_API_KEY or ANTHROPIC_API_KEY environment variable.")
+
+        # The same request again is served from the cache
+        generator.generate_questions(sample_data, difficulty='easy', count=3)
+        print(f"API calls: {generator.api_calls}, cache hits: {cache.hits}, misses: {cache.misses}")
+
+    # Deadlines and in-flight limits, against a stub that takes 0.5s per call
+    slow = APIQuestionGenerator(provider='stub', max_in_flight=2)
+    slow.client.latency_seconds = 0.5
+
+    start = time.perf_counter()
+    late = slow.generate_questions(sample_data, count=3, deadline=0.1)
+    print(f"Deadline 0.1s: {len(late)} questions after {time.perf_counter() - start:.2f}s")
+    on_time = slow.generate_questions(sample_data, count=3, deadline=2)
+    print(f"Deadline 2s: {len(on_time)} questions")
+
+    # Four callers at once: two get a slot, two are turned away immediately
+    results = []
+    callers = [
+        threading.Thread(target=lambda: results.append(len(slow.generate_questions(sample_data, count=3, deadline=2))))
+        for _ in range(4)
+    ]
+    start = time.perf_counter()
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+    print(f"4 concurrent callers with 2 slots: {sorted(results)} questions in {time.perf_counter() - start:.2f}s")
+
+    # Bulk generation for the whole library: one call per job vs batched
+    from .content_scanner import ContentScanner
+
+    scanner = ContentScanner()
+    jobs = []
+    for subject, topics in scanner.scan_subjects().items():
+        for summary in topics:
+            topic_data = scanner.get_topic_content(subject, summary['title'])
+            for difficulty in ('easy', 'medium', 'hard'):
+                jobs.append({'topic_data': topic_data, 'kind': 'questions', 'difficulty': difficulty, 'count': 10})
+            jobs.append({'topic_data': topic_data, 'kind': 'flashcards', 'count': 15})
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        batcher = APIQuestionGenerator(provider='stub', response_cache=ResponseCache(cache_dir))
+        results = batcher.generate_batch(jobs)
+        print(f"Batch: {len(jobs)} jobs, {sum(map(len, results))} items in {batcher.api_calls} API calls")
+        questions = batcher.generate_questions(jobs[0]['topic_data'], 'easy', 10)
+        print(f"Single call after the batch: {len(questions)} questions, API calls still {batcher.api_calls}")
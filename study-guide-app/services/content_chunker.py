@@ -0,0 +1,197 @@
+"""Splits topics into prompt-sized chunks and packs the most useful ones into a token budget.
+
+Chunks follow the scanner's section tree: a section's introduction and
+each of its subsections become chunks, and anything over ``max_tokens``
+is split at paragraph breaks. Token counts are estimated once when the
+index is built (about four characters per token, which is close enough
+for budgeting English prose without a tokenizer).
+
+Selection is a greedy budgeted coverage: each step takes the chunk that
+adds the most not-yet-covered key-term weight per token, where a key term
+is weighted by how few chunks mention it. Chunks that only repeat terms
+already covered lose value, so the budget is spread across the topic
+instead of being spent on its first sections.
+"""
+import math
+import re
+from typing import Dict, List, NamedTuple
+
+CHARS_PER_TOKEN = 4
+MAX_CHUNK_TOKENS = 300
+# Value of a chunk beyond its key terms, so term-free prose can still fill a budget
+BASE_WEIGHT = 0.5
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SUBSECTION_HEADING = re.compile(r'^[ \t]*###\s', re.MULTILINE)
+_WORD = re.compile(r'\w+')
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+class Chunk(NamedTuple):
+    heading: str
+    text: str
+    tokens: int
+    # Indices into ChunkIndex.terms of the key terms the chunk mentions
+    terms: frozenset
+
+
+class ChunkIndex:
+    """The chunks of one topic version with their token estimates and key terms."""
+
+    def __init__(self, chunks: List[Chunk], terms: List[str]):
+        self.chunks = chunks
+        self.terms = terms
+        mentions = [0] * len(terms)
+        for chunk in chunks:
+            for term in chunk.terms:
+                mentions[term] += 1
+        # Rare terms are worth more than ones every chunk repeats
+        self.term_weights = [math.log(1 + len(chunks) / count) if count else 0.0 for count in mentions]
+        self.total_tokens = sum(chunk.tokens for chunk in chunks)
+
+    def select(self, budget_tokens: int) -> List[Chunk]:
+        """The most informative chunks that fit in ``budget_tokens``, in document order."""
+        if self.total_tokens <= budget_tokens:
+            return list(self.chunks)
+
+        covered = set()
+        chosen = set()
+        remaining = budget_tokens
+        while True:
+            best = None
+            best_value = 0.0
+            for i, chunk in enumerate(self.chunks):
+                if i in chosen or chunk.tokens > remaining:
+                    continue
+                gain = BASE_WEIGHT + sum(self.term_weights[t] for t in chunk.terms if t not in covered)
+                value = gain / chunk.tokens
+                if value > best_value:
+                    best, best_value = i, value
+            if best is None:
+                break
+            chosen.add(best)
+            covered.update(self.chunks[best].terms)
+            remaining -= self.chunks[best].tokens
+
+        return [self.chunks[i] for i in sorted(chosen)]
+
+
+def _split(heading: str, text: str, max_tokens: int) -> List[tuple]:
+    """(heading, text) pieces of at most ``max_tokens``, cut at paragraph breaks where possible."""
+    text = text.strip()
+    if not text:
+        return []
+    if estimate_tokens(text) <= max_tokens:
+        return [(heading, text)]
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    current = ''
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            # A single paragraph longer than a chunk: cut at the last space that fits
+            cut = paragraph.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + 2 + len(paragraph) > max_chars:
+            pieces.append(current)
+            current = ''
+        if paragraph:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return [(heading, piece) for piece in pieces]
+
+
+def _words(text: str) -> str:
+    """Lowercase words padded with spaces, so terms only match whole words ("Ur" not in "during")."""
+    return f" {' '.join(_WORD.findall(text.lower()))} "
+
+
+def build_chunk_index(topic_data: Dict, max_tokens: int = MAX_CHUNK_TOKENS) -> ChunkIndex:
+    """Chunk a topic along its sections (or its raw content if it has none)."""
+    pieces = []
+    sections = topic_data.get('sections') or []
+    for section in sections:
+        intro = section['content']
+        if section['subsections']:
+            # The subsections follow the introduction in the section body
+            heading = _SUBSECTION_HEADING.search(intro)
+            intro = intro[:heading.start()] if heading else ''
+        pieces.extend(_split(section['title'], intro, max_tokens))
+        for subsection in section['subsections']:
+            heading = f"{section['title']} > {subsection['title']}"
+            pieces.extend(_split(heading, subsection['content'], max_tokens))
+
+    if not pieces and topic_data.get('content'):
+        pieces = _split(topic_data.get('title', ''), topic_data['content'], max_tokens)
+
+    terms = []
+    seen = set()
+    for key_term in topic_data.get('key_terms') or []:
+        term = _words(key_term['term'])
+        if term.strip() and term not in seen:
+            seen.add(term)
+            terms.append(term)
+
+    chunks = []
+    for heading, text in pieces:
+        haystack = _words(f"{heading}\n{text}")
+        mentioned = frozenset(i for i, term in enumerate(terms) if term in haystack)
+        chunks.append(Chunk(heading, text, estimate_tokens(heading) + estimate_tokens(text), mentioned))
+
+    return ChunkIndex(chunks, terms)
+
+
+def chunk_index(topic_data: Dict) -> ChunkIndex:
+    """The topic's chunk index, memoized on scanner records for as long as the topic version lives."""
+    if hasattr(topic_data, 'derived'):
+        return topic_data.derived('chunk_index', build_chunk_index)
+    return build_chunk_index(topic_data)
+
+
+def select_chunks(topic_data: Dict, budget_tokens: int) -> List[Chunk]:
+    return chunk_index(topic_data).select(budget_tokens)
+
+
+if __name__ == "__main__":
+    import time
+
+    from .content_scanner import ContentScanner
+
+    scanner = ContentScanner()
+    for subject, topics in scanner.scan_subjects().items():
+        for summary in topics:
+            topic = scanner.get_topic_content(subject, summary['title'])
+
+            start = time.perf_counter()
+            index = chunk_index(topic)
+            build_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            chunk_index(topic)
+            cached_us = (time.perf_counter() - start) * 1e6
+
+            print(f"{summary['title']}: {len(index.chunks)} chunks, {index.total_tokens} tokens, "
+                  f"{len(index.terms)} key terms (built in {build_ms:.1f}ms, cached lookup {cached_us:.0f}us)")
+
+            # Key terms reached by the old prompt (first 1500 characters) vs a selection of similar size
+            excerpt = _words(topic['content'][:1500])
+            old_terms = sum(1 for term in index.terms if term in excerpt)
+            for budget in (400, 800, 1600):
+                start = time.perf_counter()
+                chosen = index.select(budget)
+                select_ms = (time.perf_counter() - start) * 1000
+                terms = set().union(*(chunk.terms for chunk in chosen)) if chosen else set()
+                sections = len({chunk.heading.split(' > ')[0] for chunk in chosen})
+                print(f"  budget {budget}: {len(chosen)} chunks, {sum(c.tokens for c in chosen)} tokens, "
+                      f"{sections} sections, {len(terms)} key terms ({select_ms:.1f}ms)")
+            print(f"  first 1500 chars: {estimate_tokens(topic['content'][:1500])} tokens, {old_terms} key terms")
@@ -1,178 +1,501 @@
+import hashlib
+import json
+import mmap
 import os
-import re
+import threading
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from collections.abc import Mapping
 import markdown
 
+from .markdown_structure import parse_document
+from .metrics import CacheCounter, time_stage
+
+CORPUS_FORMAT = 'study-guide-corpus'
+CORPUS_VERSION = 1
+HEAVY_FIELDS = ('content', 'html_content', 'sections', 'key_terms', 'quiz_questions')
+
+
+class StaleTopicError(Exception):
+    """A topic's file changed or disappeared after its record was parsed."""
+
+
+# Lookups of data memoized with TopicRecord.derived, over all records
+DERIVED_CACHE = CacheCounter()
+
+
+class TopicRecord(Mapping):
+    """A parsed topic that behaves like the plain dict the scanner used to return.
+
+    Summary fields are stored eagerly. Heavy fields (raw content, HTML,
+    sections, key terms, quiz questions) are produced by a loader the first
+    time they are read and memoized on the record. A loader receives the
+    record and returns a dict of one or more fields to store. Heavy fields
+    already at hand can be passed in ``loaded``.
+    """
+
+    def __init__(self, summary: Dict, loaders: Dict[str, Callable[['TopicRecord'], Dict]],
+                 loaded: Optional[Dict] = None):
+        self._summary = summary
+        self._loaders = loaders
+        self._loaded: Dict = dict(loaded or {})
+        self._derived: Dict = {}
+        # Re-entrant: one loader may read another heavy field (html needs content)
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        if key in self._summary:
+            return self._summary[key]
+        if key not in self._loaders:
+            raise KeyError(key)
+
+        with self._lock:
+            if key not in self._loaded:
+                self._loaded.update(self._loaders[key](self))
+            return self._loaded[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._summary
+        yield from self._loaders
+
+    def __len__(self) -> int:
+        return len(self._summary) + len(self._loaders)
+
+    def is_loaded(self, key: str) -> bool:
+        """Whether a heavy field has already been computed."""
+        return key in self._summary or key in self._loaded
+
+    def derived(self, key: str, factory: Callable[['TopicRecord'], object]):
+        """Memoize data computed from this topic (e.g. a search index).
+
+        Lives exactly as long as the record, so it is dropped together with
+        the parsed topic when the source file changes.
+        """
+        with self._lock:
+            hit = key in self._derived
+            DERIVED_CACHE.record(hit)
+            if not hit:
+                self._derived[key] = factory(self)
+            return self._derived[key]
+
+
 class ContentScanner:
     """Scans the Subjects folder and extracts structured content from markdown files."""
 
-    def __init__(self, subjects_path: str = None):
+    def __init__(self, subjects_path: str = None, corpus_path: str = None):
         if subjects_path is None:
             # Default to Subjects folder in parent directory
             self.subjects_path = Path(__file__).parent.parent.parent / "Subjects"
         else:
             self.subjects_path = Path(subjects_path)
 
-    def scan_subjects(self) -> Dict:
-        """Scan all subjects and topics in the Subjects folder."""
-        subjects = {}
+        if corpus_path is None:
+            self.corpus_path = Path(__file__).parent.parent / "data" / "corpus.jsonl"
+        else:
+            self.corpus_path = Path(corpus_path)
+
+        self._lock = threading.RLock()
+        # file path -> ((mtime_ns, size), parsed topic or None)
+        self._file_cache: Dict[str, Tuple[Tuple[int, int], Optional[Dict]]] = {}
+        # Parsed-topic cache lookups: reused (hit) or parsed (miss)
+        self.topic_cache = CacheCounter(size=lambda: len(self._file_cache))
+        # subject name -> markdown file paths, in folder order
+        self._subject_files: Dict[str, List[str]] = {}
+        # (subject, title) -> file path
+        self._topic_index: Dict[Tuple[str, str], str] = {}
+        # Changes whenever any topic is added, removed or edited
+        self.index_version = ''
+        self.index_last_modified = 0.0
+        # Set by ContentWatcher: file events keep the in-memory index
+        # current, so lookups never need to touch the disk.
+        self._watched = False
+        # Keep the raw text of newly parsed files on their records (set
+        # while watched, so handlers need not read it back from disk)
+        self._keep_content = False
+
+        self._corpus_map = None
+        self._load_corpus()
 
-        if not self.subjects_path.exists():
+    def scan_subjects(self) -> Dict:
+        """Scan all subjects and topics in the Subjects folder.
+
+        Only files whose (mtime, size) changed since the last scan are
+        re-parsed; everything else is served from the parsed-topic cache.
+        While a ContentWatcher is attached the in-memory index is returned
+        without touching the disk.
+        """
+        with time_stage('scanner_scan'):
+            return self._scan_subjects()
+
+    def _scan_subjects(self) -> Dict:
+        if self._watched:
+            return self._subjects_from_index()
+
+        subject_files = {}
+
+        if self.subjects_path.exists():
+            for subject_folder in self.subjects_path.iterdir():
+                if subject_folder.is_dir():
+                    subject_files[subject_folder.name] = self._list_markdown_files(subject_folder)
+
+        for paths in subject_files.values():
+            for path in paths:
+                self._load_topic(Path(path))
+
+        with self._lock:
+            seen = {path for paths in subject_files.values() for path in paths}
+            # Forget files that have been deleted since the last scan
+            for path in list(self._file_cache):
+                if path not in seen:
+                    del self._file_cache[path]
+            self._subject_files = subject_files
+            self._rebuild_index()
+            return self._subjects_from_index()
+
+    def set_watched(self, watched: bool):
+        """Mark the in-memory index as kept current by a file watcher."""
+        self._keep_content = watched
+        if watched and not self._watched:
+            # Build the initial index before lookups stop touching the disk
+            self.scan_subjects()
+        self._watched = watched
+
+    def refresh_path(self, path) -> None:
+        """Bring the index up to date for a single changed path.
+
+        ``path`` may be a markdown file inside a subject folder or a subject
+        folder itself. It is re-read if it exists and dropped otherwise;
+        nothing else in the tree is rescanned.
+        """
+        path = Path(path)
+
+        if path.parent == self.subjects_path:
+            subject_name = path.name
+            if path.is_dir():
+                files = self._list_markdown_files(path)
+                for file in files:
+                    self._load_topic(Path(file))
+                with self._lock:
+                    self._subject_files[subject_name] = files
+                    self._rebuild_index()
+            else:
+                with self._lock:
+                    for file in self._subject_files.pop(subject_name, []):
+                        self._file_cache.pop(file, None)
+                    self._rebuild_index()
+            return
+
+        if path.parent.parent != self.subjects_path or not self._is_markdown(path):
+            return
+
+        key = str(path)
+        exists = path.is_file()
+        if exists:
+            self._load_topic(path)
+
+        with self._lock:
+            if not exists and path.parent.name not in self._subject_files:
+                return
+            files = self._subject_files.setdefault(path.parent.name, [])
+            if exists and key not in files:
+                files.append(key)
+            elif not exists:
+                if key in files:
+                    files.remove(key)
+                self._file_cache.pop(key, None)
+            self._rebuild_index()
+
+    def _is_markdown(self, file: Path) -> bool:
+        return file.suffix.lower() in ['.md', '.markdown']
+
+    def _list_markdown_files(self, folder: Path) -> List[str]:
+        return [str(file) for file in folder.iterdir() if self._is_markdown(file)]
+
+    def _subjects_from_index(self) -> Dict:
+        """Build the scan_subjects() structure from cached topics."""
+        with self._lock:
+            subjects = {}
+            for subject_name, paths in self._subject_files.items():
+                topics = []
+                for path in paths:
+                    cached = self._file_cache.get(path)
+                    if cached is not None and cached[1]:
+                        topics.append(cached[1])
+                subjects[subject_name] = topics
             return subjects
 
-        for subject_folder in self.subjects_path.iterdir():
-            if subject_folder.is_dir():
-                subject_name = subject_folder.name
-                subjects[subject_name] = self._scan_subject_folder(subject_folder)
+    def _rebuild_index(self):
+        """Rebuild the (subject, title) index from cached topics. Caller holds the lock."""
+        index = {}
+        fingerprint = hashlib.sha256()
+        last_modified = 0.0
+        for subject_name, topics in self._subjects_from_index().items():
+            fingerprint.update(f"{subject_name}\0".encode('utf-8'))
+            for topic in topics:
+                index.setdefault((subject_name, topic['title']), topic['file_path'])
+                fingerprint.update(f"{topic['file_path']}\0{topic['version']}\0".encode('utf-8'))
+                last_modified = max(last_modified, self.get_last_modified(topic['file_path']) or 0.0)
+        self._topic_index = index
+        self.index_version = fingerprint.hexdigest()
+        self.index_last_modified = last_modified
+
+    def get_last_modified(self, file_path: str) -> Optional[float]:
+        """Modification time (epoch seconds) of an indexed file, without touching the disk."""
+        cached = self._file_cache.get(file_path)
+        return cached[0][0] / 1e9 if cached is not None else None
+
+    def _load_topic(self, file_path: Path) -> Optional[Dict]:
+        """Return the parsed topic for a file, re-parsing only if it changed."""
+        key = str(file_path)
+        try:
+            stat = file_path.stat()
+        except OSError:
+            with self._lock:
+                self._file_cache.pop(key, None)
+            return None
 
-        return subjects
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._file_cache.get(key)
+        hit = cached is not None and cached[0] == signature
+        self.topic_cache.record(hit)
+        if hit:
+            return cached[1]
+
+        topic_data = self._parse_markdown_file(file_path)
+        with self._lock:
+            self._file_cache[key] = (signature, topic_data)
+        return topic_data
+
+    def _parse_markdown_file(self, file_path: Path) -> Optional[TopicRecord]:
+        """Parse a markdown file into a topic record.
+
+        Only the summary (title, counts, word count) is kept, plus the raw
+        text while a watcher is attached. The sections, key terms, quiz
+        questions and rendered HTML (and otherwise the raw text) are rebuilt
+        the first time they are accessed. Text read back from the file must
+        still hash to the record's version, or StaleTopicError is raised.
+        """
+        try:
+            content = self._read_file(file_path)
+            document = parse_document(content)
 
-    def _scan_subject_folder(self, folder: Path) -> List[Dict]:
-        """Scan a subject folder for markdown files."""
-        topics = []
+            version = self._content_version(content)
+            summary = {
+                'title': document.title if document.title is not None else file_path.stem,
+                'file_path': str(file_path),
+                'version': version,
+                'word_count': len(content.split()),
+                'sections_count': len(document.sections),
+                'key_terms_count': document.key_terms_count,
+                'quiz_questions_count': len(document.quiz_questions)
+            }
 
-        for file in folder.iterdir():
-            if file.suffix.lower() in ['.md', '.markdown']:
-                topic_data = self._parse_markdown_file(file)
-                if topic_data:
-                    topics.append(topic_data)
+            load_structure = lambda topic: self._parse_structure(topic['content'])
+            return TopicRecord(summary, {
+                'content': lambda topic: self._reload_content(file_path, version),
+                'html_content': lambda topic: {'html_content': self._render_html(topic['content'])},
+                'sections': load_structure,
+                'key_terms': load_structure,
+                'quiz_questions': load_structure
+            }, loaded={'content': content} if self._keep_content else None)
+        except Exception as e:
+            print(f"Error parsing {file_path}: {e}")
+            return None
 
-        return topics
+    def _read_file(self, file_path: Path) -> str:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
 
-    def _parse_markdown_file(self, file_path: Path) -> Dict:
-        """Parse a markdown file and extract structured content."""
+    def _reload_content(self, file_path: Path, version: str) -> Dict:
+        """The raw text of a parsed file, if it is still the text that was parsed."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Extract title (first H1)
-            title_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
-            title = title_match.group(1) if title_match else file_path.stem
+            content = self._read_file(file_path)
+        except OSError as e:
+            raise StaleTopicError(f"{file_path} is no longer readable: {e}")
+        if self._content_version(content) != version:
+            raise StaleTopicError(f"{file_path} changed since it was parsed")
+        return {'content': content}
+
+    def _render_html(self, content: str) -> str:
+        with time_stage('markdown_render'):
+            return markdown.markdown(content, extensions=['tables', 'fenced_code'])
+
+    def _parse_structure(self, content: str) -> Dict:
+        """Extract sections, key terms and embedded quiz questions in one pass."""
+        document = parse_document(content)
+        return {
+            'sections': document.materialize_sections(),
+            'key_terms': document.materialize_key_terms(),
+            'quiz_questions': document.materialize_quiz_questions()
+        }
+
+    def compile_corpus(self, output_path: str = None) -> int:
+        """Write every topic, fully parsed and rendered, to a corpus file.
+
+        The file is JSON lines: a header, then two lines per topic -- a
+        small entry (subject, relative path, hash, summary) followed by the
+        heavy fields. Returns the number of topics written.
+        """
+        output_path = Path(output_path) if output_path else self.corpus_path
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        watched, self._watched = self._watched, False
+        try:
+            subjects = self.scan_subjects()
+        finally:
+            self._watched = watched
+
+        topics = [
+            (subject_name, topic)
+            for subject_name, subject_topics in subjects.items()
+            for topic in subject_topics
+        ]
+
+        tmp_path = output_path.with_suffix(output_path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            header = {'format': CORPUS_FORMAT, 'version': CORPUS_VERSION, 'topics': len(topics)}
+            f.write(json.dumps(header) + '\n')
+            for subject_name, topic in topics:
+                file_path = Path(topic['file_path'])
+                stat = file_path.stat()
+                summary = {key: topic[key] for key in topic if key not in HEAVY_FIELDS}
+                summary.pop('file_path')
+                entry = {
+                    'subject': subject_name,
+                    'path': file_path.relative_to(self.subjects_path).as_posix(),
+                    'sha256': topic['version'],
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'summary': summary
+                }
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.write(json.dumps({key: topic[key] for key in HEAVY_FIELDS}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, output_path)
+
+        return len(topics)
+
+    def _load_corpus(self):
+        """Seed the topic cache from the compiled corpus, if there is one.
+
+        The corpus is memory-mapped and only the small entry lines are
+        decoded; heavy fields are decoded from the map when first accessed.
+        Entries whose source file changed (by hash) are ignored, and those
+        files are parsed live on the next scan.
+        """
+        if not self.corpus_path.exists():
+            return
 
-            # Parse sections
-            sections = self._parse_sections(content)
+        try:
+            with open(self.corpus_path, 'rb') as f:
+                corpus_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            header = json.loads(corpus_map.readline())
+            if header.get('format') != CORPUS_FORMAT or header.get('version') != CORPUS_VERSION:
+                print(f"Ignoring corpus {self.corpus_path}: unsupported format, recompile with add-content.py")
+                corpus_map.close()
+                return
+
+            while True:
+                entry_line = corpus_map.readline()
+                if not entry_line:
+                    break
+                heavy_start = corpus_map.tell()
+                corpus_map.readline()
+                heavy_end = corpus_map.tell()
+
+                entry = json.loads(entry_line)
+                file_path = self.subjects_path / entry['path']
+                signature = self._corpus_signature(file_path, entry)
+                if signature is None:
+                    continue
+
+                summary = dict(entry['summary'], file_path=str(file_path))
+                load_heavy = self._corpus_loader(corpus_map, heavy_start, heavy_end)
+                topic = TopicRecord(summary, {field: load_heavy for field in HEAVY_FIELDS})
+
+                with self._lock:
+                    self._file_cache[str(file_path)] = (signature, topic)
+                    self._subject_files.setdefault(entry['subject'], []).append(str(file_path))
+
+            self._corpus_map = corpus_map
+            with self._lock:
+                self._rebuild_index()
+        except Exception as e:
+            print(f"Error loading corpus {self.corpus_path}: {e}")
 
-            # Extract key terms and vocabulary
-            key_terms = self._extract_key_terms(content, sections)
+    def _corpus_signature(self, file_path: Path, entry: Dict) -> Optional[Tuple[int, int]]:
+        """Return the file's current signature if its content matches the corpus entry.
 
-            # Extract quiz questions if present
-            quiz_questions = self._extract_quiz_questions(content)
+        Files with the same mtime and size as at compile time are trusted
+        without reading them; anything else (e.g. a fresh checkout) is hashed.
+        """
+        try:
+            stat = file_path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == (entry['mtime_ns'], entry['size']):
+                return signature
+            content = self._read_file(file_path)
+        except OSError:
+            return None
 
-            return {
-                'title': title,
-                'file_path': str(file_path),
-                'content': content,
-                'html_content': markdown.markdown(content, extensions=['tables', 'fenced_code']),
-                'sections': sections,
-                'key_terms': key_terms,
-                'quiz_questions': quiz_questions,
-                'word_count': len(content.split())
-            }
-        except Exception as e:
-            print(f"Error parsing {file_path}: {e}")
+        if self._content_version(content) != entry['sha256']:
             return None
+        return signature
+
+    def _corpus_loader(self, corpus_map, start: int, end: int) -> Callable[[TopicRecord], Dict]:
+        return lambda topic: json.loads(corpus_map[start:end])
 
-    def _parse_sections(self, content: str) -> List[Dict]:
-        """Extract sections from markdown content."""
-        sections = []
-
-        # Split by H2 headers
-        section_pattern = r'^##\s+(.+?)$'
-        matches = list(re.finditer(section_pattern, content, re.MULTILINE))
-
-        for i, match in enumerate(matches):
-            section_title = match.group(1).strip()
-            start = match.end()
-            end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
-            section_content = content[start:end].strip()
-
-            sections.append({
-                'title': section_title,
-                'content': section_content,
-                'subsections': self._parse_subsections(section_content)
-            })
-
-        return sections
-
-    def _parse_subsections(self, content: str) -> List[Dict]:
-        """Extract subsections (H3) from section content."""
-        subsections = []
-
-        subsection_pattern = r'^###\s+(.+?)$'
-        matches = list(re.finditer(subsection_pattern, content, re.MULTILINE))
-
-        for i, match in enumerate(matches):
-            subsection_title = match.group(1).strip()
-            start = match.end()
-            end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
-            subsection_content = content[start:end].strip()
-
-            subsections.append({
-                'title': subsection_title,
-                'content': subsection_content
-            })
-
-        return subsections
-
-    def _extract_key_terms(self, content: str, sections: List[Dict]) -> List[Dict]:
-        """Extract key terms and their definitions."""
-        key_terms = []
-
-        # Look for bold terms followed by definitions
-        # Pattern: **TERM** or ### TERM
-
-        # From H3 subsections (like **SUMERIANS**)
-        for section in sections:
-            if 'KEY TERMS' in section['title'].upper() or 'VOCABULARY' in section['title'].upper():
-                for subsection in section.get('subsections', []):
-                    term = subsection['title'].strip('*').strip()
-                    definition = subsection['content']
-                    key_terms.append({
-                        'term': term,
-                        'definition': definition
-                    })
-
-        # Also extract from bullet points with bold terms
-        bold_term_pattern = r'\*\*([^*]+)\*\*[:\s]*([^\n]+)'
-        matches = re.findall(bold_term_pattern, content)
-        for term, definition in matches:
-            if len(definition) > 10:  # Only meaningful definitions
-                key_terms.append({
-                    'term': term.strip(),
-                    'definition': definition.strip()
-                })
-
-        return key_terms
-
-    def _extract_quiz_questions(self, content: str) -> List[Dict]:
-        """Extract existing quiz questions from the content."""
-        quiz_questions = []
-
-        # Look for numbered questions with answers (like "1. Question? **Answer**")
-        question_pattern = r'^\d+\.\s+(.+?)\s+\*\*(.+?)\*\*'
-        matches = re.findall(question_pattern, content, re.MULTILINE)
-
-        for question, answer in matches:
-            quiz_questions.append({
-                'question': question.strip(),
-                'answer': answer.strip(),
-                'source': 'embedded'
-            })
-
-        return quiz_questions
+    def _content_version(self, content: str) -> str:
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
     def get_topic_content(self, subject: str, topic_title: str) -> Dict:
         """Get detailed content for a specific topic."""
-        subjects = self.scan_subjects()
-
-        if subject in subjects:
-            for topic in subjects[subject]:
-                if topic['title'] == topic_title:
-                    return topic
-
+        with time_stage('scanner_lookup'):
+            return self._get_topic_content(subject, topic_title)
+
+    def _get_topic_content(self, subject: str, topic_title: str) -> Dict:
+        # A record is only returned once its raw text is known to match its
+        # version (the ETag and cache key), so its heavy fields can't be
+        # built from newer bytes. A changed file is re-parsed, a deleted
+        # one dropped (None, so the caller answers 404).
+        for _ in range(2):
+            topic = self._find_topic(subject, topic_title)
+            if topic is None:
+                return None
+            try:
+                topic['content']
+                return topic
+            except StaleTopicError as e:
+                print(f"Reloading topic: {e}")
+                with self._lock:
+                    # Force a re-parse even if the file kept its mtime and size
+                    self._file_cache.pop(topic['file_path'], None)
+                self.refresh_path(topic['file_path'])
         return None
 
+    def _find_topic(self, subject: str, topic_title: str) -> Optional[TopicRecord]:
+        with self._lock:
+            path = self._topic_index.get((subject, topic_title))
+            if self._watched:
+                cached = self._file_cache.get(path) if path is not None else None
+                if path is not None:
+                    self.topic_cache.record(cached is not None)
+                return cached[1] if cached is not None else None
+
+        if path is not None:
+            topic = self._load_topic(Path(path))
+            if topic and topic['title'] == topic_title:
+                return topic
+
+        # Unknown topic or the indexed file changed title/disappeared:
+        # rescan (cheap for unchanged files) and try the index again.
+        self.scan_subjects()
+        with self._lock:
+            path = self._topic_index.get((subject, topic_title))
+            cached = self._file_cache.get(path) if path is not None else None
+
+        return cached[1] if cached is not None else None
 
 if __name__ == "__main__":
     # Test the scanner
@@ -183,4 +506,4 @@ if __name__ == "__main__":
     for subject, topics in subjects.items():
         print(f"\n{subject}:")
         for topic in topics:
-            print(f"  - {topic['title']} ({len(topic['sections'])} sections, {len(topic['key_terms'])} key terms)")
+            print(f"  - {topic['title']} ({topic['sections_count']} sections, {topic['key_terms_count']} key terms)")
@@ -0,0 +1,110 @@
+import threading
+from pathlib import Path
+from typing import Set
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _SubjectsEventHandler(FileSystemEventHandler):
+    """Forwards watchdog events to the ContentWatcher as changed paths."""
+
+    def __init__(self, watcher: 'ContentWatcher'):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        self.watcher.queue_path(event.src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            self.watcher.queue_path(dest_path)
+
+
+class ContentWatcher:
+    """Keeps a ContentScanner's in-memory index in sync with the Subjects folder.
+
+    File events are collected and applied in batches so a burst of writes
+    (an editor save, a git checkout) turns into one re-parse per file.
+    Changes become visible at most ``debounce_seconds`` after the last event
+    plus the time to parse the affected files.
+    """
+
+    def __init__(self, scanner, debounce_seconds: float = 0.5):
+        self.scanner = scanner
+        self.debounce_seconds = debounce_seconds
+        self._pending: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._observer = None
+        self._worker = None
+
+    def start(self) -> bool:
+        """Index the Subjects folder and start watching it. Returns False if watching is unavailable."""
+        if Observer is None:
+            print("Warning: watchdog library not installed. Install with: pip install watchdog")
+            return False
+
+        subjects_path = self.scanner.subjects_path
+        if not subjects_path.exists():
+            print(f"Warning: {subjects_path} does not exist, content changes will not be watched")
+            return False
+
+        # Watch before the initial scan, so a change made while scanning is
+        # queued (and re-applied afterwards) instead of lost
+        self._observer = Observer()
+        self._observer.schedule(_SubjectsEventHandler(self), str(subjects_path), recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+
+        self.scanner.set_watched(True)
+
+        self._worker = threading.Thread(target=self._run, name='content-watcher', daemon=True)
+        self._worker.start()
+        return True
+
+    def stop(self):
+        """Stop watching; the scanner goes back to checking files on lookup."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._worker is not None:
+            self._worker.join()
+        self.scanner.set_watched(False)
+
+    def queue_path(self, path: str):
+        """Schedule a path to be re-read by the scanner."""
+        with self._pending_lock:
+            self._pending.add(path)
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            # Let a burst of events settle before touching the files
+            self._stopped.wait(self.debounce_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Apply every queued change to the scanner's index."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+
+        subjects_path = self.scanner.subjects_path
+        for path in sorted(pending):
+            path = Path(path)
+            # Events for files inside a renamed/removed subject folder are
+            # covered by the event for the folder itself.
+            if path.parent != subjects_path and path.parent.parent != subjects_path:
+                continue
+            try:
+                self.scanner.refresh_path(path)
+            except Exception as e:
+                print(f"Error reindexing {path}: {e}")
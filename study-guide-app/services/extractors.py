@@ -0,0 +1,208 @@
+"""Text extractors used by the local question generator.
+
+All patterns are compiled once at import time. Each achievement marker
+keeps its own pattern: a sentence can hold several markers ("conquered
+cities and founded Akkad"), and one alternation would let the first match
+swallow the span the next marker needs.
+"""
+import itertools
+import re
+from typing import Dict, List, Tuple
+
+ACHIEVEMENT_MARKERS = ['created', 'built', 'founded', 'conquered', 'developed', 'invented', 'established']
+# Verbs that turn a sentence into a fact (the marker list minus 'established')
+FACT_VERBS = ['created', 'built', 'founded', 'conquered', 'developed', 'invented']
+
+COMMON_WORDS = {'The', 'This', 'That', 'These', 'Those'}
+
+BULLET_PATTERN = re.compile(r'[-•]\s*(.+?)(?=\n|$)')
+FACT_PATTERN = re.compile(rf"({'|'.join(FACT_VERBS)})\s+(.+?)(?=[.!?\n])", re.IGNORECASE)
+ENTITY_PATTERN = re.compile(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b')
+# Dates like "1792 BCE", "490 BC", "c. 2300 BC"
+DATE_PATTERN = re.compile(r'(c\.\s*)?(\d{1,4}(?:\s*-\s*\d{1,4})?)\s*(BCE?|CE?|BC|AD)')
+ACHIEVEMENT_PATTERNS = [
+    (marker, re.compile(rf'(\w+(?:\s+\w+){{0,2}})\s+{marker}\s+(.+?)(?=[.!?\n])', re.IGNORECASE))
+    for marker in ACHIEVEMENT_MARKERS
+]
+
+
+def extract_facts(text: str) -> List[str]:
+    """Extract factual statements from text."""
+    facts = []
+
+    # Look for bullet points
+    for bullet in BULLET_PATTERN.findall(text):
+        bullet = bullet.strip()
+        if len(bullet) > 20:
+            facts.append(bullet)
+
+    # Look for sentences with achievements
+    facts.extend(f"{verb} {obj}" for verb, obj in FACT_PATTERN.findall(text))
+
+    return facts[:5]  # Limit facts
+
+
+class SectionIndex:
+    """Entities, dates and achievement phrases of one section, with their offsets.
+
+    Built once per section: one scan for dates, one for capitalized
+    phrases and the achievement scans. The two scans are separate because
+    their matches can overlap ("2000 Christians", "Titanic. 1912 AD").
+    Question builders cut context windows straight from the recorded
+    offsets instead of searching the text again.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        # entity -> offset of its first occurrence, in order of appearance
+        self.entity_offsets: Dict[str, int] = {}
+        # (date, start, end)
+        self.date_spans: List[Tuple[str, int, int]] = []
+
+        for match in DATE_PATTERN.finditer(text):
+            self.date_spans.append((match.group(0), match.start(), match.end()))
+
+        for match in ENTITY_PATTERN.finditer(text):
+            entity = match.group(0)
+            if len(entity) > 3 and entity not in COMMON_WORDS:
+                self.entity_offsets.setdefault(entity, match.start())
+
+        self.achievements = _scan_achievements(text)
+
+    def entities(self, limit: int = 10) -> List[str]:
+        """Unique entities in order of first appearance."""
+        return list(itertools.islice(self.entity_offsets, limit))
+
+    def entity_context(self, entity: str, window: int = 100) -> str:
+        """The text around the first occurrence of an entity."""
+        index = self.entity_offsets.get(entity)
+        if index is None:
+            return find_context(entity, self.text, window)
+        return self._window(index, index + len(entity), window)
+
+    def dates(self, limit: int = 5) -> List[Tuple[str, str]]:
+        """(date, surrounding text) pairs, 50 characters either side."""
+        return [(date, self._window(start, end, 50)) for date, start, end in self.date_spans[:limit]]
+
+    def _window(self, start: int, end: int, window: int) -> str:
+        return self.text[max(0, start - window):end + window].strip()
+
+
+def index_topic(sections: List[Dict]) -> List[SectionIndex]:
+    """Index every section of a topic."""
+    return [SectionIndex(section['content']) for section in sections]
+
+
+def extract_entities(text: str) -> List[str]:
+    """Extract proper nouns and key entities (unique, in order of appearance)."""
+    return SectionIndex(text).entities()
+
+
+def extract_dates(text: str) -> List[Tuple[str, str]]:
+    """Extract dates and the text surrounding them."""
+    return SectionIndex(text).dates()
+
+
+def extract_achievements(text: str) -> List[Dict]:
+    """Extract achievements and accomplishments."""
+    return _scan_achievements(text)[:5]
+
+
+def _scan_achievements(text: str) -> List[Dict]:
+    """Every achievement phrase, grouped by marker in ACHIEVEMENT_MARKERS order."""
+    achievements = []
+
+    for marker, pattern in ACHIEVEMENT_PATTERNS:
+        for match in pattern.finditer(text):
+            subject, detail = match.groups()
+            achievements.append({
+                'subject': subject.strip(),
+                'action': marker,
+                'detail': detail.strip()[:100],
+                'offset': match.start()
+            })
+
+    return achievements
+
+
+def find_context(entity: str, text: str, window: int = 100) -> str:
+    """Return the text around the first occurrence of an entity."""
+    index = text.find(entity)
+    if index == -1:
+        return ""
+    start = max(0, index - window)
+    end = min(len(text), index + len(entity) + window)
+    return text[start:end].strip()
+
+
+if __name__ == "__main__":
+    # Microbenchmark: the old per-call patterns against the compiled ones,
+    # run over every section of every study guide.
+    # Run from study-guide-app/: python -m services.extractors
+    import timeit
+    from services.content_scanner import ContentScanner
+
+    def legacy_achievements(text):
+        achievements = []
+        for marker in ACHIEVEMENT_MARKERS:
+            pattern = rf'(\w+(?:\s+\w+){{0,2}})\s+{marker}\s+(.+?)(?=[.!?\n])'
+            for subject, detail in re.findall(pattern, text, re.IGNORECASE):
+                achievements.append({'subject': subject.strip(), 'action': marker, 'detail': detail.strip()[:100]})
+        return achievements
+
+    def without_offsets(achievements):
+        return [{key: value for key, value in a.items() if key != 'offset'} for a in achievements]
+
+    def legacy_section_pass(text):
+        re.findall(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b', text)
+        list(re.finditer(r'(c\.\s*)?(\d{1,4}(?:\s*-\s*\d{1,4})?)\s*(BCE?|CE?|BC|AD)', text))
+        for marker in ACHIEVEMENT_MARKERS:
+            re.findall(rf'(\w+(?:\s+\w+){{0,2}})\s+{marker}\s+(.+?)(?=[.!?\n])', text, re.IGNORECASE)
+        re.findall(r'[-•]\s*(.+?)(?=\n|$)', text)
+        re.findall(r'(created|built|founded|conquered|developed|invented)\s+(.+?)(?=[.!?\n])', text, re.IGNORECASE)
+        for entity in set(re.findall(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b', text)):
+            re.search(re.escape(entity), text)
+
+    def compiled_section_pass(text):
+        index = SectionIndex(text)
+        index.dates()
+        extract_facts(text)
+        for entity in index.entity_offsets:
+            index.entity_context(entity)
+
+    sections = [
+        section['content']
+        for topics in ContentScanner().scan_subjects().values()
+        for topic in topics
+        for section in topic['sections']
+    ]
+
+    # Sentences with several marker verbs keep every marker's match
+    samples = sections + [
+        "Sargon conquered cities and founded Akkad.",
+        "The Sumerians invented writing, built ziggurats and developed irrigation.\nHammurabi established laws.",
+    ]
+    for text in samples:
+        assert without_offsets(_scan_achievements(text)) == legacy_achievements(text), text
+    print(f"Achievements match the per-marker patterns on {len(samples)} texts")
+
+    # Dates and entities that overlap each other are both kept
+    samples += ["In 2000 Christians gathered.", "The Titanic. 1912 AD was the year it sank."]
+    for text in samples:
+        index = SectionIndex(text)
+        legacy_dates = [m.group(0) for m in re.finditer(r'(c\.\s*)?(\d{1,4}(?:\s*-\s*\d{1,4})?)\s*(BCE?|CE?|BC|AD)', text)]
+        legacy_entities = {e for e in re.findall(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b', text)
+                           if len(e) > 3 and e not in COMMON_WORDS}
+        assert [date for date, _, _ in index.date_spans] == legacy_dates, text
+        assert set(index.entity_offsets) == legacy_entities, text
+    print(f"Dates and entities match the separate patterns on {len(samples)} texts")
+
+    runs = 20
+    legacy = timeit.timeit(lambda: [legacy_section_pass(s) for s in sections], number=runs)
+    compiled = timeit.timeit(lambda: [compiled_section_pass(s) for s in sections], number=runs)
+    per_section = runs * len(sections)
+
+    print(f"{len(sections)} sections, {runs} runs")
+    print(f"  legacy:   {legacy / per_section * 1e6:8.1f} us/section")
+    print(f"  compiled: {compiled / per_section * 1e6:8.1f} us/section")
+    print(f"  speedup:  {legacy / compiled:.2f}x")
@@ -0,0 +1,409 @@
+"""Grading of quiz submissions.
+
+Every answer and every correct answer is normalized once and each
+question is graded once per submission. An AnswerKey holds a quiz's
+normalized correct answers so it can be built once per generated quiz
+and reused for every submission of it, or for regrading stored records.
+
+With fuzzy matching (the default, ``FUZZY_GRADING=false`` turns it off)
+answers are compared as stemmed keywords: a keyword may have a typo or
+two, an answer is correct if each of its keywords is part of the correct
+answer, and a long-form answer is also correct if it covers most of the
+correct answer's keywords. Tokens and trigram signatures of correct
+answers are computed once and cached.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+FUZZY_GRADING = os.getenv('FUZZY_GRADING', 'true').lower() != 'false'
+
+# Correct answers with at least this many keywords are graded by coverage too
+LONG_ANSWER_KEYWORDS = 4
+# Fraction of a long answer's keywords an answer has to mention
+KEYWORD_COVERAGE = 0.7
+
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'of', 'and', 'or', 'to', 'in', 'on', 'at', 'for', 'by', 'with',
+    'is', 'was', 'were', 'are', 'be', 'been', 'it', 'its', 'that', 'this', 'who',
+    'which', 'what', 'as', 'from'
+})
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def normalize_answer(answer) -> str:
+    """The form answers are compared in: stripped and lowercase."""
+    if answer is None:
+        return ''
+    return str(answer).strip().lower()
+
+
+@lru_cache(maxsize=8192)
+def stem(word: str) -> str:
+    """Strip common inflections so "rivers", "ruled" and "cities" match "river", "rule" and "city"."""
+    if word.endswith("'s"):
+        word = word[:-2]
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith('ss'):
+            word = word[:-len(suffix)]
+            break
+    if len(word) >= 4 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+
+def keywords(normalized: str) -> Tuple[str, ...]:
+    """Stemmed tokens of a normalized answer, without stopwords."""
+    return tuple(stem(token) for token in _TOKEN_PATTERN.findall(normalized) if token not in STOPWORDS)
+
+
+def max_typos(token: str) -> int:
+    """Edits a keyword may differ by: none for numbers and short words."""
+    if not token.isalpha() or len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 7 else 2
+
+
+def within_edit_distance(a: str, b: str, limit: int) -> bool:
+    """Whether a and b are at most ``limit`` edits apart (adjacent swaps count as one).
+
+    Only the band of the distance table within ``limit`` of the diagonal
+    is filled (cells outside it are over the limit anyway), and it gives
+    up as soon as a whole row of the band exceeds the limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+
+    over = limit + 1
+    width = len(b) + 1
+    before_previous = None
+    previous = [j if j <= limit else over for j in range(width)]
+    for i in range(1, len(a) + 1):
+        current = [over] * width
+        if i <= limit:
+            current[0] = i
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        char = a[i - 1]
+        row_min = current[low - 1]
+        for j in range(low, high + 1):
+            # Plain comparisons: min() is most of the cost in this loop
+            value = previous[j - 1] if char == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (j > 1 and i > 1 and char == b[j - 2] and a[i - 2] == b[j - 1]
+                    and before_previous[j - 2] + 1 < value):
+                value = before_previous[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return False
+        before_previous, previous = previous, current
+    return previous[-1] <= limit
+
+
+def _trigrams(token: str) -> FrozenSet[str]:
+    padded = f'$${token}$$'
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class KeyAnswer:
+    """A correct answer prepared for fuzzy matching.
+
+    Keeps the keywords and an index from trigram to keyword. One edit
+    (an adjacent swap included) removes at most four distinct trigrams, so
+    a keyword within ``k`` edits of a token shares at least
+    ``max(trigrams) - 4k`` of them; only
+    keywords passing that count are compared by edit distance. Matches
+    are memoized, since many students give the same answers.
+    """
+
+    __slots__ = ('normalized', 'keywords', 'keyword_set', '_trigram_index', '_trigram_counts', '_matches', '_verdicts')
+
+    # Memoized token matches and verdicts kept per answer
+    MAX_MEMOIZED = 256
+
+    def __init__(self, normalized: str):
+        self.normalized = normalized
+        self.keywords = keywords(normalized)
+        self.keyword_set = frozenset(self.keywords)
+        self._trigram_index: Dict[str, List[str]] = {}
+        self._trigram_counts: Dict[str, int] = {}
+        for keyword in self.keyword_set:
+            if max_typos(keyword):
+                trigrams = _trigrams(keyword)
+                self._trigram_counts[keyword] = len(trigrams)
+                for trigram in trigrams:
+                    self._trigram_index.setdefault(trigram, []).append(keyword)
+        self._matches: Dict[str, Optional[str]] = {}
+        self._verdicts: Dict[str, bool] = {}
+
+    def match(self, token: str) -> Optional[str]:
+        """The keyword a user's (stemmed) token stands for, if any."""
+        if token in self.keyword_set:
+            return token
+        try:
+            return self._matches[token]
+        except KeyError:
+            pass
+
+        match = self._fuzzy_match(token)
+        if len(self._matches) >= self.MAX_MEMOIZED:
+            self._matches.clear()
+        self._matches[token] = match
+        return match
+
+    def _fuzzy_match(self, token: str) -> Optional[str]:
+        limit = max_typos(token)
+        if not limit:
+            return None
+
+        trigrams = _trigrams(token)
+        shared: Dict[str, int] = {}
+        for trigram in trigrams:
+            for keyword in self._trigram_index.get(trigram, ()):
+                shared[keyword] = shared.get(keyword, 0) + 1
+
+        for keyword, count in shared.items():
+            keyword_limit = min(limit, max_typos(keyword))
+            if count < max(len(trigrams), self._trigram_counts[keyword]) - 4 * keyword_limit:
+                continue
+            if within_edit_distance(token, keyword, keyword_limit):
+                return keyword
+        return None
+
+    def accepts(self, user_answer: str) -> bool:
+        """Grade a normalized user answer against this correct answer."""
+        if not user_answer:
+            return False
+        if user_answer == self.normalized:
+            return True
+        try:
+            return self._verdicts[user_answer]
+        except KeyError:
+            pass
+
+        verdict = self._grade(user_answer)
+        if len(self._verdicts) >= self.MAX_MEMOIZED:
+            self._verdicts.clear()
+        self._verdicts[user_answer] = verdict
+        return verdict
+
+    def _grade(self, user_answer: str) -> bool:
+        if not self.keywords:
+            # Answers made only of stopwords ("A", "the") must match exactly
+            return False
+        user_keywords = keywords(user_answer)
+        if not user_keywords:
+            return False
+
+        matched = [self.match(token) for token in user_keywords]
+        if all(matched):
+            return True
+        if len(self.keyword_set) >= LONG_ANSWER_KEYWORDS:
+            covered = len(set(matched) & self.keyword_set)
+            return covered >= KEYWORD_COVERAGE * len(self.keyword_set)
+        return False
+
+
+@lru_cache(maxsize=4096)
+def key_answer(normalized: str) -> KeyAnswer:
+    """The (cached) fuzzy matcher for a normalized correct answer."""
+    return KeyAnswer(normalized)
+
+
+def is_correct(user_answer: str, correct_answer: str, fuzzy: Optional[bool] = None) -> bool:
+    """Compare a normalized answer with a normalized correct answer. Empty answers are never correct."""
+    if fuzzy is None:
+        fuzzy = FUZZY_GRADING
+    if fuzzy:
+        return key_answer(correct_answer).accepts(user_answer)
+    return bool(user_answer) and user_answer in correct_answer
+
+
+class AnswerKey:
+    """Normalized correct answers of one quiz, in question order."""
+
+    __slots__ = ('answers', '_key_answers')
+
+    def __init__(self, answers: Sequence[str]):
+        self.answers = tuple(answers)
+        self._key_answers = None
+
+    @classmethod
+    def from_questions(cls, questions: Sequence[Dict]) -> 'AnswerKey':
+        return cls(normalize_answer(question.get('answer', '')) for question in questions)
+
+    def key_answers(self) -> Tuple[KeyAnswer, ...]:
+        """Fuzzy matchers for every answer, prepared on first use."""
+        if self._key_answers is None:
+            self._key_answers = tuple(key_answer(answer) for answer in self.answers)
+        return self._key_answers
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+
+class GradedSubmission(NamedTuple):
+    correct_count: int
+    # One flag per question; unanswered questions are False
+    results: List[bool]
+
+    @property
+    def total_questions(self) -> int:
+        return len(self.results)
+
+    @property
+    def score_percentage(self) -> float:
+        if not self.results:
+            return 0
+        return self.correct_count / len(self.results) * 100
+
+
+def grade_submission(questions: Sequence[Dict], answers: Sequence[str],
+                     answer_key: Optional[AnswerKey] = None, fuzzy: Optional[bool] = None) -> GradedSubmission:
+    """Grade one submission against its questions.
+
+    ``answer_key`` is used when it has one answer per question; otherwise
+    a key is built from the questions. ``fuzzy`` defaults to FUZZY_GRADING.
+    """
+    if answer_key is None or len(answer_key) != len(questions):
+        answer_key = AnswerKey.from_questions(questions)
+    if fuzzy is None:
+        fuzzy = FUZZY_GRADING
+
+    answered = min(len(answers), len(answer_key))
+    if fuzzy:
+        key_answers = answer_key.key_answers()
+        results = [key_answers[i].accepts(normalize_answer(answers[i])) for i in range(answered)]
+    else:
+        results = [
+            is_correct(normalize_answer(answers[i]), answer_key.answers[i], fuzzy=False)
+            for i in range(answered)
+        ]
+    correct_count = sum(results)
+    results.extend([False] * (len(answer_key) - answered))
+    return GradedSubmission(correct_count, results)
+
+
+def grade_submissions(submissions: Iterable[Tuple[Sequence[Dict], Sequence[str]]],
+                      answer_key: Optional[AnswerKey] = None, fuzzy: Optional[bool] = None) -> List[GradedSubmission]:
+    """Grade many (questions, answers) submissions in one pass.
+
+    A given ``answer_key`` is used for every submission. Otherwise the
+    submissions may mix quizzes: one key is built per distinct set of
+    correct answers and shared by every submission of that quiz.
+    """
+    if answer_key is not None:
+        return [grade_submission(questions, answers, answer_key, fuzzy) for questions, answers in submissions]
+
+    answer_keys: Dict[Tuple[str, ...], AnswerKey] = {}
+    graded = []
+    for questions, answers in submissions:
+        correct_answers = tuple(normalize_answer(question.get('answer', '')) for question in questions)
+        quiz_key = answer_keys.get(correct_answers)
+        if quiz_key is None:
+            quiz_key = answer_keys[correct_answers] = AnswerKey(correct_answers)
+        graded.append(grade_submission(questions, answers, quiz_key, fuzzy))
+    return graded
+
+
+def regrade_quiz_record(quiz_record: Dict, fuzzy: Optional[bool] = None) -> Dict:
+    """A stored quiz record with its correctness and score recomputed.
+
+    Uses the questions and answers saved in the record, so historical
+    quizzes can be graded again after the matching rules change.
+    """
+    pairs = quiz_record.get('questions_and_answers', [])
+    answer_key = AnswerKey(normalize_answer(pair.get('correct_answer', '')) for pair in pairs)
+    graded = grade_submission(pairs, [pair.get('user_answer', '') for pair in pairs], answer_key, fuzzy)
+
+    regraded = dict(quiz_record)
+    regraded['correct_answers'] = graded.correct_count
+    regraded['score_percentage'] = round(graded.score_percentage, 2)
+    regraded['questions_and_answers'] = [
+        dict(pair, was_correct=was_correct)
+        for pair, was_correct in zip(pairs, graded.results)
+    ]
+    return regraded
+
+
+def regrade_quiz_records(quiz_records: Iterable[Dict], fuzzy: Optional[bool] = None) -> List[Dict]:
+    """Regrade a batch of stored quiz records."""
+    return [regrade_quiz_record(quiz_record, fuzzy) for quiz_record in quiz_records]
+
+
+if __name__ == "__main__":
+    # Microbenchmark: the old per-question grading (normalize and compare
+    # twice) against grading with a cached answer key, exact and fuzzy.
+    # Run from study-guide-app/: python -m services.grading
+    import random
+    import timeit
+
+    def legacy_grade(questions, answers):
+        correct_count = 0
+        for i, question in enumerate(questions):
+            if i < len(answers):
+                user_answer = answers[i].strip().lower()
+                correct_answer = str(question.get('answer', '')).strip().lower()
+                if user_answer == correct_answer or user_answer in correct_answer:
+                    correct_count += 1
+        was_correct = [
+            i < len(answers) and answers[i].strip().lower() in str(q.get('answer', '')).strip().lower()
+            for i, q in enumerate(questions)
+        ]
+        return correct_count, was_correct
+
+    rng = random.Random(0)
+    questions = [
+        {'question': f'Q{i}', 'answer': f'The Babylonian king who wrote law code number {i}'}
+        for i in range(20)
+    ]
+    submissions = [
+        [rng.choice(['babylonian king', 'wrong answer', 'Babylonain kings', f'law code {i}']) for i in range(20)]
+        for _ in range(1000)
+    ]
+    answer_key = AnswerKey.from_questions(questions)
+
+    # Submissions of two quizzes with the same number of questions, mixed
+    # together, are each graded against their own quiz
+    other_quiz = [{'question': f'Q{i}', 'answer': f'Sargon of Akkad, ruler number {i}'} for i in range(20)]
+    mixed = grade_submissions([(questions, ['babylonian king'] * 20), (other_quiz, ['Sargon'] * 20)])
+    assert [g.correct_count for g in mixed] == [20, 20], mixed
+
+    def typo(word):
+        i = rng.randrange(len(word))
+        return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+    def unseen_answer(i):
+        # A misspelled answer plus a made-up word no student has sent yet
+        made_up = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(8))
+        return f"{typo('babylonian')} {typo('king')} {made_up} {i}"
+
+    runs = 10
+    legacy = timeit.timeit(lambda: [legacy_grade(questions, a) for a in submissions], number=runs)
+    exact = timeit.timeit(lambda: grade_submissions(((questions, a) for a in submissions), answer_key, fuzzy=False), number=runs)
+    fuzzy = timeit.timeit(lambda: grade_submissions(((questions, a) for a in submissions), answer_key, fuzzy=True), number=runs)
+    per_submission = runs * len(submissions)
+
+    # Fuzzy grading of answers that have not been memoized: every run
+    # starts from fresh matchers and grades answers it has not seen
+    cold = 0.0
+    for _ in range(runs):
+        key_answer.cache_clear()
+        cold_key = AnswerKey.from_questions(questions)
+        unseen = [[unseen_answer(i) for i in range(20)] for _ in range(len(submissions))]
+        cold += timeit.timeit(lambda: grade_submissions(((questions, a) for a in unseen), cold_key, fuzzy=True), number=1)
+
+    print(f"{len(submissions)} submissions of {len(questions)} questions, {runs} runs")
+    print(f"  legacy:       {legacy / per_submission * 1e6:8.1f} us/submission")
+    print(f"  exact:        {exact / per_submission * 1e6:8.1f} us/submission ({legacy / exact:.2f}x)")
+    print(f"  fuzzy:        {fuzzy / per_submission * 1e6:8.1f} us/submission ({legacy / fuzzy:.2f}x), repeated answers")
+    print(f"  fuzzy, cold:  {cold / per_submission * 1e6:8.1f} us/submission, unseen answers")
@@ -0,0 +1,108 @@
+import json
+from typing import List
+
+
+class JSONArrayParser:
+    """Pulls the objects out of a JSON array while its text is still arriving.
+
+    Feed it the response text chunk by chunk; each ``feed`` returns the
+    objects completed by that chunk. Anything before the opening ``[``
+    (prose, a Markdown code fence) is skipped, as is a bracketed aside
+    that holds no objects. An object that does not parse is dropped
+    without affecting the ones after it. Every character
+    is examined once, and only the unfinished object is kept buffered.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # Buffer offset where the current top-level object began
+        self._start = None
+        self.count = 0
+        self.done = False
+
+    def feed(self, text: str) -> List[dict]:
+        if self.done:
+            return []
+
+        buffer = self._buffer + text
+        items = []
+        i = self._pos
+        depth = self._depth
+        in_string = self._in_string
+        escaped = self._escaped
+        start = self._start
+
+        while i < len(buffer):
+            char = buffer[i]
+            if depth == 0:
+                if char == '[':
+                    depth = 1
+                elif start is None:
+                    # Nothing before the array is worth keeping
+                    i = buffer.find('[', i + 1)
+                    if i < 0:
+                        i = len(buffer)
+                    continue
+            elif in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '{[':
+                if depth == 1 and char == '{':
+                    start = i
+                depth += 1
+            elif char in '}]':
+                depth -= 1
+                if depth == 1 and start is not None:
+                    try:
+                        items.append(json.loads(buffer[start:i + 1]))
+                        self.count += 1
+                    except ValueError:
+                        pass
+                    start = None
+                elif depth == 0:
+                    if self.count:
+                        self.done = True
+                        break
+                    # An empty or bracketed aside ("[10] questions"): look for the next array
+            i += 1
+
+        if start is None:
+            self._buffer = ''
+            self._pos = 0
+        else:
+            self._buffer = buffer[start:]
+            self._pos = i - start
+            start = 0
+        self._depth = depth
+        self._in_string = in_string
+        self._escaped = escaped
+        self._start = start
+        return items
+
+
+if __name__ == "__main__":
+    import time
+
+    items = [{'question': f'Question {i} with "quotes", [brackets] and {{braces}}?', 'answer': f'Answer {i}'}
+             for i in range(200)]
+    text = "Here are the questions:\n```json\n" + json.dumps(items, indent=2) + "\n```"
+
+    for piece in (1, 7, 64, len(text)):
+        parser = JSONArrayParser()
+        parsed = []
+        start = time.perf_counter()
+        for offset in range(0, len(text), piece):
+            parsed.extend(parser.feed(text[offset:offset + piece]))
+        elapsed = (time.perf_counter() - start) * 1000
+        assert parsed == items and parser.done
+        print(f"{len(text)} chars in {piece}-char pieces: {len(parsed)} objects in {elapsed:.1f}ms")
@@ -0,0 +1,312 @@
+import itertools
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+# Anchored patterns, only tried where a match could start.
+# Using the scanner's original expressions keeps the output identical.
+_TITLE_PATTERN = re.compile(r'#\s+(.+)$', re.MULTILINE)
+_SECTION_PATTERN = re.compile(r'##\s+(.+?)$', re.MULTILINE)
+_SUBSECTION_PATTERN = re.compile(r'###\s+(.+?)$', re.MULTILINE)
+_BOLD_TERM_PATTERN = re.compile(r'\*\*([^*]+)\*\*[:\s]*([^\n]+)')
+_QUIZ_QUESTION_PATTERN = re.compile(r'\d+\.\s+(.+?)\s+\*\*(.+?)\*\*', re.MULTILINE)
+_LEADING_SPACE = re.compile(r'\s*')
+# Line starts that could begin a heading or a numbered quiz question
+_LINE_START_PATTERN = re.compile(r'\n[#\d]')
+
+
+class Span(NamedTuple):
+    """A titled region of the source: the heading text and its body offsets."""
+    title: str
+    start: int
+    end: int
+
+
+class SectionSpan(NamedTuple):
+    title: str
+    start: int
+    end: int
+    subsections: List[Span]
+
+
+class PairSpan(NamedTuple):
+    """Offsets of a (term, definition) or (question, answer) pair."""
+    first_start: int
+    first_end: int
+    second_start: int
+    second_end: int
+
+
+class DocumentStructure:
+    """Offsets of the title, H2/H3 tree, bold terms and quiz questions in a markdown buffer.
+
+    Nothing but heading titles is copied out of the source; the dicts the
+    rest of the app works with are materialized on demand.
+    """
+
+    def __init__(self, source: str, title: Optional[str], sections: List[SectionSpan],
+                 bold_terms: List[PairSpan], quiz_questions: List[PairSpan]):
+        self.source = source
+        self.title = title
+        self.sections = sections
+        self.bold_terms = bold_terms
+        self.quiz_questions = quiz_questions
+
+    def _is_glossary(self, section: SectionSpan) -> bool:
+        title = section.title.upper()
+        return 'KEY TERMS' in title or 'VOCABULARY' in title
+
+    @property
+    def key_terms_count(self) -> int:
+        return sum(
+            len(section.subsections) for section in self.sections if self._is_glossary(section)
+        ) + len(self.bold_terms)
+
+    def materialize_sections(self) -> List[Dict]:
+        source = self.source
+        return [
+            {
+                'title': section.title,
+                'content': source[section.start:section.end].strip(),
+                'subsections': [
+                    {
+                        'title': subsection.title,
+                        'content': source[subsection.start:subsection.end].strip()
+                    }
+                    for subsection in section.subsections
+                ]
+            }
+            for section in self.sections
+        ]
+
+    def materialize_key_terms(self) -> List[Dict]:
+        source = self.source
+        key_terms = []
+
+        # From H3 subsections of a key terms / vocabulary section
+        for section in self.sections:
+            if self._is_glossary(section):
+                for subsection in section.subsections:
+                    key_terms.append({
+                        'term': subsection.title.strip('*').strip(),
+                        'definition': source[subsection.start:subsection.end].strip()
+                    })
+
+        # Bold terms followed by a definition
+        for span in self.bold_terms:
+            key_terms.append({
+                'term': source[span.first_start:span.first_end].strip(),
+                'definition': source[span.second_start:span.second_end].strip()
+            })
+
+        return key_terms
+
+    def materialize_quiz_questions(self) -> List[Dict]:
+        source = self.source
+        return [
+            {
+                'question': source[span.first_start:span.first_end].strip(),
+                'answer': source[span.second_start:span.second_end].strip(),
+                'source': 'embedded'
+            }
+            for span in self.quiz_questions
+        ]
+
+
+def parse_document(source: str) -> DocumentStructure:
+    """Parse a markdown buffer without rescanning it once per extractor.
+
+    One scan finds every line that starts with ``#`` or a digit, and only
+    those lines are checked against the heading and quiz patterns; bold
+    terms come from one scan of their own. Produces the same title, sections,
+    subsections, key terms and embedded quiz questions as running the
+    scanner's separate regular expressions over the whole document.
+    """
+    title = None
+    sections: List[SectionSpan] = []
+    bold_terms: List[PairSpan] = []
+    quiz_questions: List[PairSpan] = []
+
+    section_title = None
+    section_start = 0
+    # Line starts in the current section that could begin an H3
+    subsection_starts: List[int] = []
+
+    # Matches never overlap, so each extractor resumes after its last match
+    section_floor = 0
+    quiz_cursor = 0
+
+    # Bold terms can start anywhere and span lines, so they get their own
+    # scan; the pattern begins with a literal and is searched at C speed.
+    for match in _BOLD_TERM_PATTERN.finditer(source):
+        if match.end(2) - match.start(2) > 10:  # Only meaningful definitions
+            bold_terms.append(PairSpan(*match.span(1), *match.span(2)))
+
+    line_starts = _LINE_START_PATTERN.finditer(source)
+    if source[:1] == '#' or source[:1].isdecimal():
+        line_starts = itertools.chain([0], (event.start() + 1 for event in line_starts))
+    else:
+        line_starts = (event.start() + 1 for event in line_starts)
+
+    for pos in line_starts:
+        first = source[pos]
+
+        if first != '#':
+            if pos >= quiz_cursor:
+                match = _QUIZ_QUESTION_PATTERN.match(source, pos)
+                if match:
+                    quiz_questions.append(PairSpan(*match.span(1), *match.span(2)))
+                    quiz_cursor = match.end()
+            continue
+
+        after_hashes = source[pos + 1:pos + 4]
+
+        if title is None and after_hashes[:1].isspace():
+            match = _TITLE_PATTERN.match(source, pos)
+            if match:
+                title = match.group(1)
+
+        elif pos >= section_floor and after_hashes[:1] == '#' and after_hashes[1:2].isspace():
+            match = _SECTION_PATTERN.match(source, pos)
+            if match:
+                if section_title is not None:
+                    sections.append(SectionSpan(
+                        section_title, section_start, pos,
+                        _parse_subsections(source, section_start, pos, subsection_starts)
+                    ))
+                section_title = match.group(1).strip()
+                section_start = section_floor = match.end()
+                subsection_starts = []
+
+                # Section bodies are stripped before looking for H3s, so an
+                # indented H3 on the first body line still counts.
+                lead = _LEADING_SPACE.match(source, section_start).end()
+                if (source[lead - 1:lead] != '\n' and source.startswith('###', lead)
+                        and source[lead + 3:lead + 4].isspace()):
+                    subsection_starts.append(lead)
+
+        elif section_title is not None and after_hashes[:2] == '##' and after_hashes[2:3].isspace():
+            subsection_starts.append(pos)
+
+    if section_title is not None:
+        sections.append(SectionSpan(
+            section_title, section_start, len(source),
+            _parse_subsections(source, section_start, len(source), subsection_starts)
+        ))
+
+    return DocumentStructure(source, title, sections, bold_terms, quiz_questions)
+
+
+def _parse_subsections(source: str, start: int, end: int, candidates: List[int]) -> List[Span]:
+    """Match H3s at the candidate line starts of the section body ``source[start:end]``.
+
+    The old scanner matched H3s in the stripped section body, so matches
+    stop at the body's last non-space character: a trailing ``###`` with
+    no text is not a heading, and a heading's title never runs on into
+    the next section.
+    """
+    while end > start and source[end - 1].isspace():
+        end -= 1
+
+    subsections: List[Span] = []
+    title = None
+    body_start = 0
+    floor = start
+    for pos in candidates:
+        if pos < floor:
+            continue
+        match = _SUBSECTION_PATTERN.match(source, pos, end)
+        if match:
+            if title is not None:
+                subsections.append(Span(title, body_start, pos))
+            title = match.group(1).strip()
+            body_start = floor = match.end()
+
+    if title is not None:
+        subsections.append(Span(title, body_start, end))
+    return subsections
+
+
+if __name__ == "__main__":
+    # Check against the scanner's old per-extractor regexes on the study
+    # guides, on headings with no text and on randomized input.
+    # Run from study-guide-app/: python -m services.markdown_structure
+    import random
+    from pathlib import Path
+
+    def legacy_subsections(content):
+        matches = list(re.finditer(r'^###\s+(.+?)$', content, re.MULTILINE))
+        return [
+            {
+                'title': match.group(1).strip(),
+                'content': content[match.end():matches[i + 1].start() if i + 1 < len(matches) else len(content)].strip()
+            }
+            for i, match in enumerate(matches)
+        ]
+
+    def legacy_sections(content):
+        matches = list(re.finditer(r'^##\s+(.+?)$', content, re.MULTILINE))
+        sections = []
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+            section_content = content[match.end():end].strip()
+            sections.append({
+                'title': match.group(1).strip(),
+                'content': section_content,
+                'subsections': legacy_subsections(section_content)
+            })
+        return sections
+
+    def legacy_key_terms(content, sections):
+        key_terms = []
+        for section in sections:
+            if 'KEY TERMS' in section['title'].upper() or 'VOCABULARY' in section['title'].upper():
+                for subsection in section['subsections']:
+                    key_terms.append({'term': subsection['title'].strip('*').strip(), 'definition': subsection['content']})
+        for term, definition in re.findall(r'\*\*([^*]+)\*\*[:\s]*([^\n]+)', content):
+            if len(definition) > 10:
+                key_terms.append({'term': term.strip(), 'definition': definition.strip()})
+        return key_terms
+
+    def legacy_quiz_questions(content):
+        return [
+            {'question': question.strip(), 'answer': answer.strip(), 'source': 'embedded'}
+            for question, answer in re.findall(r'^\d+\.\s+(.+?)\s+\*\*(.+?)\*\*', content, re.MULTILINE)
+        ]
+
+    def check(content):
+        document = parse_document(content)
+        title_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
+        sections = legacy_sections(content)
+        assert document.title == (title_match.group(1) if title_match else None), content
+        assert document.materialize_sections() == sections, content
+        assert document.materialize_key_terms() == legacy_key_terms(content, sections), content
+        assert document.key_terms_count == len(legacy_key_terms(content, sections)), content
+        assert document.materialize_quiz_questions() == legacy_quiz_questions(content), content
+
+    guides = list(Path(__file__).resolve().parents[2].joinpath('Subjects').rglob('*.md'))
+    for path in guides:
+        check(path.read_text(encoding='utf-8'))
+    print(f"Matches the old regexes on {len(guides)} study guides")
+
+    # Headings with no text: a bare or whitespace-only H3 closing a section
+    # is not a heading, and an empty heading line never takes the next
+    # section's heading as its title.
+    samples = [
+        "# T\n## Key Terms\n### A\nalpha\n###  ",
+        "# T\n## Key Terms\n### A\nalpha\n###",
+        "# T\n## Key Terms\n### A\nalpha\n###  \n\n## Next\ntext",
+        "# T\n## Key Terms\n###\t\n## Next\n### B\nbeta\n",
+        "# T\n## Vocabulary\n###  \nRunning title\nbody\n### \n",
+        "## Key Terms\n   ### Indented\ndef\n###   \n   \n",
+        "#  \n##  \n###  \n",
+    ]
+    for content in samples:
+        check(content)
+    print(f"Matches the old regexes on {len(samples)} empty-heading samples")
+
+    rng = random.Random(4)
+    pieces = ['# ', '## ', '### ', '#### ', '###', '##', 'Key Terms', 'Vocabulary', '**Term** a long definition here',
+              '1. Question? **Answer**', 'text', ' ', '  ', '\t', '\n', '\n', '\n\n']
+    for _ in range(5000):
+        check(''.join(rng.choice(pieces) for _ in range(rng.randint(0, 30))))
+    print("Matches the old regexes on 5000 randomized documents")
@@ -0,0 +1,235 @@
+"""In-process metrics, rendered in the Prometheus text exposition format.
+
+Recording is a lock, a bisect and two additions, so instrumentation can
+stay on in production (set ``METRICS=false`` to turn it off). Cache hit
+and miss counts are not pushed on every lookup: caches keep their own
+``hits``/``misses`` counters and are read only when ``/metrics`` is
+scraped.
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv('METRICS', 'true').lower() != 'false'
+
+# Seconds; covers cached lookups (sub-millisecond) to slow provider calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        bounds = [f'le="{bound}"' for bound in self.buckets] + ['le="+Inf"']
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        # name -> object with hits and misses (and optionally a length or size())
+        self._caches: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def track_cache(self, name: str, cache):
+        """Report a cache's ``hits``/``misses`` counters (and size, if it has one) at scrape time."""
+        self._caches[name] = cache
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+
+        caches = sorted(self._caches.items())
+        lines.append("# HELP studyguide_cache_requests_total Cache lookups by result.")
+        lines.append("# TYPE studyguide_cache_requests_total counter")
+        for name, cache in caches:
+            lines.append(f'studyguide_cache_requests_total{{cache="{_escape(name)}",result="hit"}} {cache.hits}')
+            lines.append(f'studyguide_cache_requests_total{{cache="{_escape(name)}",result="miss"}} {cache.misses}')
+        lines.append("# HELP studyguide_cache_entries Entries held by each cache.")
+        lines.append("# TYPE studyguide_cache_entries gauge")
+        for name, cache in caches:
+            if hasattr(cache, '__len__'):
+                size = len(cache)
+            elif getattr(cache, 'size', None) is not None:
+                size = cache.size()
+            else:
+                continue
+            lines.append(f'studyguide_cache_entries{{cache="{_escape(name)}"}} {size}')
+        return "\n".join(lines) + "\n"
+
+
+class CacheCounter:
+    """Hit and miss counts kept by a cache that is a plain dict rather than an LRUCache.
+
+    ``size`` returns the number of entries, if the cache has a meaningful one.
+    """
+
+    __slots__ = ('hits', 'misses', 'size', '_lock')
+
+    def __init__(self, size: Optional[Callable[[], int]] = None):
+        self.hits = 0
+        self.misses = 0
+        self.size = size
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class FunctionCacheStats:
+    """hits/misses/len view of a functools.lru_cache-wrapped function."""
+
+    def __init__(self, function: Callable):
+        self.function = function
+
+    @property
+    def hits(self) -> int:
+        return self.function.cache_info().hits
+
+    @property
+    def misses(self) -> int:
+        return self.function.cache_info().misses
+
+    def __len__(self) -> int:
+        return self.function.cache_info().currsize
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'studyguide_request_duration_seconds', 'Time to handle an HTTP request, by route.',
+    ('method', 'route', 'status')
+))
+STAGE_SECONDS = registry.register(Histogram(
+    'studyguide_stage_duration_seconds', 'Time spent in each stage of request handling.',
+    ('stage',)
+))
+GENERATIONS = registry.register(Counter(
+    'studyguide_generations_total', 'Question sets and flashcard decks served, by generator.',
+    ('kind', 'generator')
+))
+
+
+def record_stage(stage: str, seconds: float):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+class time_stage:
+    """``with time_stage('scanner_lookup'):`` records the block's duration under that stage."""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+if __name__ == "__main__":
+    from .cache import LRUCache
+
+    cache = LRUCache(max_entries=8)
+    registry.track_cache('demo', cache)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+
+    for i in range(1000):
+        with time_stage('demo_stage'):
+            pass
+        REQUEST_SECONDS.observe(0.002 * (i % 7), 'GET', '/demo', 200)
+
+    iterations = 100000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with time_stage('overhead'):
+            pass
+    per_stage = (time.perf_counter() - start) / iterations * 1e6
+    start = time.perf_counter()
+    for _ in range(iterations):
+        REQUEST_SECONDS.observe(0.003, 'GET', '/demo', 200)
+    per_observe = (time.perf_counter() - start) / iterations * 1e6
+
+    output = registry.render()
+    print("\n".join(line for line in output.splitlines() if 'demo' in line and '_bucket' not in line))
+    print(f"time_stage: {per_stage:.2f}us, observe: {per_observe:.2f}us, "
+          f"scrape: {len(output.splitlines())} lines")
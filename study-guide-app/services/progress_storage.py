@@ -0,0 +1,803 @@
+import bisect
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process file lock, so run a single worker there
+    fcntl = None
+
+
+def _log_id(header: bytes):
+    """The id in a log's header line, or None for a log without one."""
+    try:
+        header = json.loads(header)
+    except ValueError:
+        return None
+    return header.get('log_id') if isinstance(header, dict) else None
+
+
+# Topics at or above STRENGTH_SCORE are strengths, below WEAKNESS_SCORE weaknesses
+STRENGTH_SCORE = 80
+WEAKNESS_SCORE = 60
+
+# How many of the most recent quizzes the JSON backend keeps at hand
+RECENT_QUIZZES_KEPT = 50
+
+
+def _initial_overall_stats() -> Dict:
+    return {
+        'total_quizzes': 0,
+        'total_questions_answered': 0,
+        'total_correct': 0,
+        'average_score': 0,
+        'study_time_minutes': 0
+    }
+
+
+class ProgressStorage(ABC):
+    """Where ProgressTracker keeps quizzes, flashcard sessions and their aggregates.
+
+    Quiz records are the dicts built by ProgressTracker.record_quiz; topic
+    stats and overall stats have the same shape for every backend.
+    """
+
+    @abstractmethod
+    def add_quiz(self, quiz_record: Dict):
+        ...
+
+    @abstractmethod
+    def add_flashcard_session(self, session: Dict):
+        ...
+
+    @abstractmethod
+    def reset(self):
+        ...
+
+    @abstractmethod
+    def overall_stats(self) -> Dict:
+        ...
+
+    @abstractmethod
+    def topic_stats(self, subject: str, topic: str) -> Dict:
+        ...
+
+    @abstractmethod
+    def all_topic_stats(self) -> Dict[str, Dict]:
+        """Stats for every topic, keyed by "<subject>_<topic>"."""
+
+    @abstractmethod
+    def recent_quizzes(self, limit: int) -> List[Dict]:
+        """The ``limit`` most recent quizzes, newest first."""
+
+    @abstractmethod
+    def quiz_history(self, subject: str, topic: str) -> List[Dict]:
+        """Every quiz for a topic, oldest first."""
+
+    @abstractmethod
+    def strengths_and_weaknesses(self, limit: int = 5) -> Dict[str, List[Dict]]:
+        """Up to ``limit`` topic stats per category, best average score first.
+
+        Strengths score at least STRENGTH_SCORE, weaknesses below
+        WEAKNESS_SCORE and needs_review is everything in between.
+        """
+
+    @abstractmethod
+    def quizzes_since(self, timestamp: str, subject: str = None, topic: str = None) -> List[Dict]:
+        """Quizzes at or after an ISO timestamp, oldest first."""
+
+    @abstractmethod
+    def all_quizzes(self) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def all_flashcard_sessions(self) -> List[Dict]:
+        ...
+
+
+class JSONLogStorage(ProgressStorage):
+    """Progress kept in memory, persisted as an append-only event log.
+
+    Every recorded quiz or flashcard session is appended as one line to
+    ``progress.log``. ``progress.json`` is a compacted snapshot written
+    every ``snapshot_interval`` events; on startup the snapshot is loaded
+    and the newer log events are replayed on top of it.
+
+    Several processes (gunicorn workers) can share one data directory.
+    Appends and compaction hold an exclusive lock on ``progress.lock``, and
+    each write first catches up on the log so sequence numbers stay unique.
+    Reads pick up other processes' events by reading only the bytes added
+    to the log since the last read. Each log file starts with a header
+    line carrying a random id; compaction swaps in a log with a new id, so
+    a changed id means "reload from the snapshot".
+    """
+
+    def __init__(self, data_dir: Path, snapshot_interval: int = 200):
+        self.progress_file = data_dir / "progress.json"
+        self.log_file = data_dir / "progress.log"
+        self.lock_file = data_dir / "progress.lock"
+        self.snapshot_interval = snapshot_interval
+        self._thread_lock = threading.RLock()
+        self._held_lock_file = None
+        with self._locked():
+            self._reload(repair=True)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Hold the cross-process lock; re-entering from the same thread is a no-op."""
+        with self._thread_lock:
+            if self._held_lock_file is not None or fcntl is None:
+                yield
+                return
+
+            with open(self.lock_file, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._held_lock_file = f
+                try:
+                    yield
+                finally:
+                    self._held_lock_file = None
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_progress(self) -> Dict:
+        """Load the progress snapshot from JSON file."""
+        if self.progress_file.exists():
+            try:
+                with open(self.progress_file, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading progress: {e}")
+                return self._initialize_progress_data()
+        else:
+            return self._initialize_progress_data()
+
+    def _initialize_progress_data(self) -> Dict:
+        """Initialize empty progress data structure."""
+        return {
+            'quizzes': [],
+            'flashcard_sessions': [],
+            'topics_studied': {},
+            'overall_stats': _initial_overall_stats(),
+            # Sequence number of the last log event folded into this data
+            'last_event_seq': 0
+        }
+
+    def _reload(self, repair: bool = False):
+        """Load the snapshot and replay the whole log on top of it."""
+        self.progress_data = self._load_progress()
+        self._index_progress()
+        self._events_since_snapshot = 0
+        # Identity of the log file being followed, and how far it has been read
+        self._log_id = None
+        self._log_offset = None
+        self._log_size = 0
+        self._read_log(repair)
+
+    def _read_log(self, repair: bool = False) -> bool:
+        """Apply log events written since the last read.
+
+        Reading stops at a line that is incomplete or unparsable. With
+        ``repair`` (only while holding the exclusive lock) such a torn last
+        line, left by a crash mid-append, is cut off so later appends start
+        on a clean line.
+
+        Returns False if the log is no longer the file the last read
+        followed (another process compacted it); the caller then reloads
+        from the snapshot.
+        """
+        try:
+            f = open(self.log_file, 'rb')
+        except FileNotFoundError:
+            return self._log_offset is None
+
+        with f:
+            header = f.readline()
+            log_id = _log_id(header)
+            if self._log_offset is None:
+                self._log_id = log_id
+                # Logs written before headers existed start with an event
+                self._log_offset = len(header) if log_id else 0
+            elif log_id != self._log_id:
+                return False
+
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                self._log_offset += len(line)
+                if event['seq'] > self.progress_data.get('last_event_seq', 0):
+                    self._apply_event(event)
+                    self._events_since_snapshot += 1
+
+            # Nothing else writes while we read, so this is the size we've seen
+            self._log_size = os.fstat(f.fileno()).st_size
+
+        if repair and self._log_offset < self._log_size:
+            self._truncate_log()
+        return True
+
+    def _truncate_log(self):
+        print(f"Discarding incomplete entry at the end of {self.log_file}")
+        with open(self.log_file, 'r+b') as f:
+            f.truncate(self._log_offset)
+        self._log_size = self._log_offset
+
+    def _start_log(self):
+        """Replace the log with an empty one that has a new id (called under the lock)."""
+        log_id = uuid.uuid4().hex
+        header = (json.dumps({'log_id': log_id}) + '\n').encode()
+        tmp_log = self.log_file.with_suffix('.log.tmp')
+        with open(tmp_log, 'wb') as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_log, self.log_file)
+        self._log_id = log_id
+        self._log_offset = self._log_size = len(header)
+
+    def _sync(self):
+        """Catch up with events other processes have written."""
+        with self._thread_lock:
+            try:
+                with open(self.log_file, 'rb') as f:
+                    log_id = _log_id(f.readline())
+                    log_size = os.fstat(f.fileno()).st_size
+            except FileNotFoundError:
+                if self._log_offset is None:
+                    return
+                log_id, log_size = None, None
+
+            if self._log_offset is not None and log_id == self._log_id and log_size == self._log_size:
+                return
+
+            with self._locked(exclusive=False):
+                # With no log read yet, other processes may also have
+                # written a snapshot since we loaded
+                if self._log_offset is None or not self._read_log():
+                    self._reload()
+
+    def _append_event(self, event_type: str, record: Dict, compact: bool = False):
+        """Durably append an event to the log, then apply it in memory."""
+        with self._locked():
+            self._sync()
+            if self._log_offset is None:
+                self._start_log()
+            elif self._log_offset < self._log_size:
+                # Left by a writer that crashed mid-append
+                self._truncate_log()
+
+            event = {
+                'seq': self.progress_data.get('last_event_seq', 0) + 1,
+                'type': event_type,
+                'record': record
+            }
+
+            try:
+                with open(self.log_file, 'a') as f:
+                    f.write(json.dumps(event) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                print(f"Error saving progress: {e}")
+                return
+
+            self._read_log()
+            if compact or self._events_since_snapshot >= self.snapshot_interval:
+                self._save_progress()
+
+    def _apply_event(self, event: Dict):
+        """Fold one log event into progress_data."""
+        if event['type'] == 'quiz':
+            self._apply_quiz(event['record'])
+        elif event['type'] == 'flashcard_session':
+            self._apply_flashcard_session(event['record'])
+        elif event['type'] == 'reset':
+            self.progress_data = self._initialize_progress_data()
+            self._index_progress()
+        self.progress_data['last_event_seq'] = event['seq']
+
+    def _save_progress(self):
+        """Write a compacted snapshot and start a fresh log (called under the lock).
+
+        The snapshot replaces progress.json atomically and records the last
+        event it contains, so a crash before the log is replaced only
+        leaves events that replay will skip. The new log gets a new id, so
+        other processes notice the compaction.
+        """
+        try:
+            tmp_file = self.progress_file.with_suffix('.json.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(self.progress_data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.progress_file)
+
+            self._start_log()
+            self._events_since_snapshot = 0
+        except Exception as e:
+            print(f"Error saving progress: {e}")
+
+    def _index_progress(self):
+        """Build the recent-quiz heap and the topic ranking from progress_data.
+
+        Both are then kept up to date by _apply_quiz, so the stats views
+        never sort the full history.
+        """
+        # Min-heap of the newest RECENT_QUIZZES_KEPT quizzes: (timestamp, order, record)
+        self._recent: List[Tuple[str, int, Dict]] = []
+        self._quiz_order = 0
+        for quiz_record in self.progress_data['quizzes']:
+            self._remember_recent(quiz_record)
+
+        # (-average_score, first studied order, topic key), kept sorted
+        self._topic_order: Dict[str, int] = {}
+        self._topic_ranking: List[Tuple[float, int, str]] = []
+        for topic_key, topic_stats in self.progress_data['topics_studied'].items():
+            self._topic_order[topic_key] = len(self._topic_order)
+            self._topic_ranking.append(self._ranking_entry(topic_key, topic_stats))
+        self._topic_ranking.sort()
+
+    def _remember_recent(self, quiz_record: Dict):
+        entry = (quiz_record['timestamp'], self._quiz_order, quiz_record)
+        self._quiz_order += 1
+        if len(self._recent) < RECENT_QUIZZES_KEPT:
+            heapq.heappush(self._recent, entry)
+        elif entry[:2] > self._recent[0][:2]:
+            heapq.heapreplace(self._recent, entry)
+
+    def _ranking_entry(self, topic_key: str, topic_stats: Dict) -> Tuple[float, int, str]:
+        return (-topic_stats.get('average_score', 0), self._topic_order[topic_key], topic_key)
+
+    def _apply_quiz(self, quiz_record: Dict):
+        """Add a quiz to the history and update topic and overall stats."""
+        subject = quiz_record['subject']
+        topic = quiz_record['topic']
+        total_questions = quiz_record['total_questions']
+        correct_count = quiz_record['correct_answers']
+
+        # Add to quiz history
+        self.progress_data['quizzes'].append(quiz_record)
+
+        # Update topic stats
+        topic_key = f"{subject}_{topic}"
+        if topic_key not in self.progress_data['topics_studied']:
+            self.progress_data['topics_studied'][topic_key] = {
+                'subject': subject,
+                'topic': topic,
+                'times_studied': 0,
+                'total_questions': 0,
+                'total_correct': 0,
+                'average_score': 0,
+                'last_studied': None
+            }
+            self._topic_order[topic_key] = len(self._topic_order)
+        else:
+            old_entry = self._ranking_entry(topic_key, self.progress_data['topics_studied'][topic_key])
+            del self._topic_ranking[bisect.bisect_left(self._topic_ranking, old_entry)]
+
+        topic_stats = self.progress_data['topics_studied'][topic_key]
+        topic_stats['times_studied'] += 1
+        topic_stats['total_questions'] += total_questions
+        topic_stats['total_correct'] += correct_count
+        topic_stats['average_score'] = round(
+            (topic_stats['total_correct'] / topic_stats['total_questions'] * 100),
+            2
+        )
+        topic_stats['last_studied'] = quiz_record['timestamp']
+        bisect.insort(self._topic_ranking, self._ranking_entry(topic_key, topic_stats))
+        self._remember_recent(quiz_record)
+
+        # Update overall stats
+        overall = self.progress_data['overall_stats']
+        overall['total_quizzes'] += 1
+        overall['total_questions_answered'] += total_questions
+        overall['total_correct'] += correct_count
+        overall['average_score'] = round(
+            (overall['total_correct'] / overall['total_questions_answered'] * 100) if overall['total_questions_answered'] > 0 else 0,
+            2
+        )
+        overall['study_time_minutes'] += round(quiz_record['time_taken_seconds'] / 60, 2)
+
+    def _apply_flashcard_session(self, session: Dict):
+        self.progress_data['flashcard_sessions'].append(session)
+
+        # Update overall study time
+        self.progress_data['overall_stats']['study_time_minutes'] += round(session['time_taken_seconds'] / 60, 2)
+
+    def add_quiz(self, quiz_record: Dict):
+        self._append_event('quiz', quiz_record)
+
+    def add_flashcard_session(self, session: Dict):
+        self._append_event('flashcard_session', session)
+
+    def reset(self):
+        self._append_event('reset', {'timestamp': datetime.now().isoformat()}, compact=True)
+
+    def overall_stats(self) -> Dict:
+        self._sync()
+        return self.progress_data['overall_stats']
+
+    def topic_stats(self, subject: str, topic: str) -> Dict:
+        self._sync()
+        return self.progress_data['topics_studied'].get(f"{subject}_{topic}", {})
+
+    def all_topic_stats(self) -> Dict[str, Dict]:
+        self._sync()
+        return self.progress_data['topics_studied']
+
+    def recent_quizzes(self, limit: int) -> List[Dict]:
+        self._sync()
+        if limit > RECENT_QUIZZES_KEPT:
+            quizzes = self.progress_data['quizzes']
+            return sorted(quizzes, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        return [entry[2] for entry in heapq.nlargest(limit, self._recent)]
+
+    def strengths_and_weaknesses(self, limit: int = 5) -> Dict[str, List[Dict]]:
+        self._sync()
+        ranking = self._topic_ranking
+        topics = self.progress_data['topics_studied']
+        # Ranking keys are negated scores, so each category is a contiguous run
+        review_start = bisect.bisect_right(ranking, (-STRENGTH_SCORE, float('inf')))
+        weak_start = bisect.bisect_right(ranking, (-WEAKNESS_SCORE, float('inf')))
+
+        def category(start, end):
+            return [topics[entry[2]] for entry in ranking[start:min(end, start + limit)]]
+
+        return {
+            'strengths': category(0, review_start),
+            'weaknesses': category(weak_start, len(ranking)),
+            'needs_review': category(review_start, weak_start)
+        }
+
+    def quiz_history(self, subject: str, topic: str) -> List[Dict]:
+        self._sync()
+        return [
+            quiz for quiz in self.progress_data['quizzes']
+            if quiz['subject'] == subject and quiz['topic'] == topic
+        ]
+
+    def quizzes_since(self, timestamp: str, subject: str = None, topic: str = None) -> List[Dict]:
+        self._sync()
+        # ISO timestamps from datetime.isoformat() compare correctly as strings
+        filtered = [
+            q for q in self.progress_data['quizzes']
+            if q['timestamp'] >= timestamp
+            and (not subject or q['subject'] == subject)
+            and (not topic or q['topic'] == topic)
+        ]
+        return sorted(filtered, key=lambda x: x['timestamp'])
+
+    def all_quizzes(self) -> List[Dict]:
+        self._sync()
+        return self.progress_data['quizzes']
+
+    def all_flashcard_sessions(self) -> List[Dict]:
+        self._sync()
+        return self.progress_data['flashcard_sessions']
+
+
+class SQLiteStorage(ProgressStorage):
+    """Progress in a SQLite database, for histories too large to keep in memory.
+
+    Quizzes are indexed on (subject, topic, timestamp) and on timestamp, so
+    topic history, the most recent N quizzes and time-window trends are
+    index range scans. Topic and overall stats are kept in their own tables
+    and updated in the same transaction as each insert.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS quizzes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            total_questions INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_quizzes_topic_time ON quizzes (subject, topic, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_quizzes_time ON quizzes (timestamp);
+
+        CREATE TABLE IF NOT EXISTS flashcard_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            record TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS topic_stats (
+            subject TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            times_studied INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            total_correct INTEGER NOT NULL,
+            average_score REAL NOT NULL,
+            last_studied TEXT,
+            PRIMARY KEY (subject, topic)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_topic_stats_score ON topic_stats (average_score);
+
+        CREATE TABLE IF NOT EXISTS overall_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            stats TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def add_quiz(self, quiz_record: Dict):
+        with self._transaction() as conn:
+            self._insert_quiz(conn, quiz_record)
+
+    def _insert_quiz(self, conn: sqlite3.Connection, quiz_record: Dict):
+        subject = quiz_record['subject']
+        topic = quiz_record['topic']
+        total_questions = quiz_record['total_questions']
+        correct_count = quiz_record['correct_answers']
+
+        conn.execute(
+            'INSERT INTO quizzes (timestamp, subject, topic, total_questions, correct_answers, record) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (quiz_record['timestamp'], subject, topic, total_questions, correct_count, json.dumps(quiz_record))
+        )
+
+        row = conn.execute(
+            'SELECT times_studied, total_questions, total_correct FROM topic_stats WHERE subject = ? AND topic = ?',
+            (subject, topic)
+        ).fetchone()
+        times_studied, topic_questions, topic_correct = tuple(row) if row else (0, 0, 0)
+        times_studied += 1
+        topic_questions += total_questions
+        topic_correct += correct_count
+        conn.execute(
+            # Upsert keeps the rowid, so topics stay in first-studied order
+            'INSERT INTO topic_stats VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (subject, topic) DO UPDATE SET times_studied = excluded.times_studied, '
+            'total_questions = excluded.total_questions, total_correct = excluded.total_correct, '
+            'average_score = excluded.average_score, last_studied = excluded.last_studied',
+            (subject, topic, times_studied, topic_questions, topic_correct,
+             round(topic_correct / topic_questions * 100, 2), quiz_record['timestamp'])
+        )
+
+        overall = self._overall_stats(conn)
+        overall['total_quizzes'] += 1
+        overall['total_questions_answered'] += total_questions
+        overall['total_correct'] += correct_count
+        overall['average_score'] = round(
+            (overall['total_correct'] / overall['total_questions_answered'] * 100) if overall['total_questions_answered'] > 0 else 0,
+            2
+        )
+        overall['study_time_minutes'] += round(quiz_record['time_taken_seconds'] / 60, 2)
+        self._save_overall_stats(conn, overall)
+
+    def add_flashcard_session(self, session: Dict):
+        with self._transaction() as conn:
+            self._insert_flashcard_session(conn, session)
+
+    def _insert_flashcard_session(self, conn: sqlite3.Connection, session: Dict):
+        conn.execute(
+            'INSERT INTO flashcard_sessions (timestamp, record) VALUES (?, ?)',
+            (session['timestamp'], json.dumps(session))
+        )
+        overall = self._overall_stats(conn)
+        overall['study_time_minutes'] += round(session['time_taken_seconds'] / 60, 2)
+        self._save_overall_stats(conn, overall)
+
+    def import_records(self, quizzes: List[Dict], flashcard_sessions: List[Dict]):
+        """Bulk-load existing records (e.g. from the JSON backend) into an empty database.
+
+        Runs in one transaction and does nothing if the database already has
+        records, so workers starting together import only once.
+        """
+        with self._transaction() as conn:
+            if not self.is_empty():
+                return
+            for quiz_record in quizzes:
+                self._insert_quiz(conn, quiz_record)
+            for session in flashcard_sessions:
+                self._insert_flashcard_session(conn, session)
+
+    def is_empty(self) -> bool:
+        conn = self._connection()
+        return (conn.execute('SELECT 1 FROM quizzes LIMIT 1').fetchone() is None
+                and conn.execute('SELECT 1 FROM flashcard_sessions LIMIT 1').fetchone() is None)
+
+    def reset(self):
+        with self._transaction() as conn:
+            for table in ('quizzes', 'flashcard_sessions', 'topic_stats', 'overall_stats'):
+                conn.execute(f'DELETE FROM {table}')
+
+    def _overall_stats(self, conn: sqlite3.Connection) -> Dict:
+        row = conn.execute('SELECT stats FROM overall_stats WHERE id = 1').fetchone()
+        return json.loads(row['stats']) if row else _initial_overall_stats()
+
+    def _save_overall_stats(self, conn: sqlite3.Connection, overall: Dict):
+        conn.execute('INSERT OR REPLACE INTO overall_stats (id, stats) VALUES (1, ?)', (json.dumps(overall),))
+
+    def _topic_stats_dict(self, row: sqlite3.Row) -> Dict:
+        return {
+            'subject': row['subject'],
+            'topic': row['topic'],
+            'times_studied': row['times_studied'],
+            'total_questions': row['total_questions'],
+            'total_correct': row['total_correct'],
+            'average_score': row['average_score'],
+            'last_studied': row['last_studied']
+        }
+
+    def _quiz_records(self, rows) -> List[Dict]:
+        return [json.loads(row['record']) for row in rows]
+
+    def overall_stats(self) -> Dict:
+        return self._overall_stats(self._connection())
+
+    def topic_stats(self, subject: str, topic: str) -> Dict:
+        row = self._connection().execute(
+            'SELECT * FROM topic_stats WHERE subject = ? AND topic = ?', (subject, topic)
+        ).fetchone()
+        return self._topic_stats_dict(row) if row else {}
+
+    def all_topic_stats(self) -> Dict[str, Dict]:
+        rows = self._connection().execute('SELECT * FROM topic_stats ORDER BY rowid')
+        return {f"{row['subject']}_{row['topic']}": self._topic_stats_dict(row) for row in rows}
+
+    def recent_quizzes(self, limit: int) -> List[Dict]:
+        rows = self._connection().execute(
+            'SELECT record FROM quizzes ORDER BY timestamp DESC LIMIT ?', (limit,)
+        )
+        return self._quiz_records(rows)
+
+    def strengths_and_weaknesses(self, limit: int = 5) -> Dict[str, List[Dict]]:
+        conn = self._connection()
+
+        def category(condition, params):
+            rows = conn.execute(
+                f'SELECT * FROM topic_stats WHERE {condition} ORDER BY average_score DESC, rowid LIMIT ?',
+                (*params, limit)
+            )
+            return [self._topic_stats_dict(row) for row in rows]
+
+        return {
+            'strengths': category('average_score >= ?', (STRENGTH_SCORE,)),
+            'weaknesses': category('average_score < ?', (WEAKNESS_SCORE,)),
+            'needs_review': category('average_score >= ? AND average_score < ?', (WEAKNESS_SCORE, STRENGTH_SCORE))
+        }
+
+    def quiz_history(self, subject: str, topic: str) -> List[Dict]:
+        rows = self._connection().execute(
+            'SELECT record FROM quizzes WHERE subject = ? AND topic = ? ORDER BY timestamp',
+            (subject, topic)
+        )
+        return self._quiz_records(rows)
+
+    def quizzes_since(self, timestamp: str, subject: str = None, topic: str = None) -> List[Dict]:
+        query = 'SELECT record FROM quizzes WHERE timestamp >= ?'
+        params = [timestamp]
+        if subject:
+            query += ' AND subject = ?'
+            params.append(subject)
+        if topic:
+            query += ' AND topic = ?'
+            params.append(topic)
+        rows = self._connection().execute(query + ' ORDER BY timestamp', params)
+        return self._quiz_records(rows)
+
+    def all_quizzes(self) -> List[Dict]:
+        return self._quiz_records(self._connection().execute('SELECT record FROM quizzes ORDER BY id'))
+
+    def all_flashcard_sessions(self) -> List[Dict]:
+        rows = self._connection().execute('SELECT record FROM flashcard_sessions ORDER BY id')
+        return [json.loads(row['record']) for row in rows]
+
+
+class _Transaction:
+    """``with`` block running its statements in one write transaction."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def create_storage(backend: str, data_dir: Path, snapshot_interval: int = 200) -> ProgressStorage:
+    """Build a storage backend by name: 'json' (default) or 'sqlite'.
+
+    A new SQLite database is seeded from any existing JSON progress in the
+    same directory.
+    """
+    if backend == 'sqlite':
+        storage = SQLiteStorage(data_dir / "progress.db")
+        if storage.is_empty() and ((data_dir / "progress.json").exists() or (data_dir / "progress.log").exists()):
+            legacy = JSONLogStorage(data_dir, snapshot_interval)
+            storage.import_records(legacy.all_quizzes(), legacy.all_flashcard_sessions())
+        return storage
+
+    if backend != 'json':
+        print(f"Unknown progress backend '{backend}', using json")
+    return JSONLogStorage(data_dir, snapshot_interval)
+
+
+def _stress_worker(data_dir: str, backend: str, quizzes: int):
+    from services.progress_tracker import ProgressTracker
+
+    tracker = ProgressTracker(data_dir, snapshot_interval=25, backend=backend)
+    questions = [{'question': 'Who was Hammurabi?', 'answer': 'Babylonian king'}]
+    for i in range(quizzes):
+        tracker.record_quiz('Social Studies', f'Topic {i % 3}', 'easy', questions, ['Babylonian king'], 30)
+        tracker.get_overall_stats()
+
+
+if __name__ == "__main__":
+    # Stress test: several processes record quizzes into one data directory
+    # at once, as gunicorn workers do. Every quiz must be counted once, and a
+    # tracker that was open the whole time must see all of them.
+    # Run from study-guide-app/: python -m services.progress_storage
+    import multiprocessing
+    import tempfile
+    import time
+    from services.progress_tracker import ProgressTracker
+
+    processes, quizzes = 8, 100
+    for backend in ('json', 'sqlite'):
+        with tempfile.TemporaryDirectory() as data_dir:
+            observer = ProgressTracker(data_dir, snapshot_interval=25, backend=backend)
+
+            start = time.perf_counter()
+            workers = [
+                multiprocessing.Process(target=_stress_worker, args=(data_dir, backend, quizzes))
+                for _ in range(processes)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            expected = processes * quizzes
+            fresh = ProgressTracker(data_dir, backend=backend)
+            counts = {
+                'observer': observer.get_overall_stats()['total_quizzes'],
+                'fresh': fresh.get_overall_stats()['total_quizzes'],
+                'history': len(fresh.storage.all_quizzes()),
+                'topics': sum(t['times_studied'] for t in fresh.get_topic_stats().values())
+            }
+            ok = all(count == expected for count in counts.values())
+            print(f"{backend}: {expected} quizzes from {processes} processes in {elapsed:.2f}s "
+                  f"-> {counts} {'OK' if ok else 'MISMATCH'}")
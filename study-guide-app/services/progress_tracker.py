@@ -1,73 +1,53 @@
-import json
 import os
-from datetime import datetime
+import re
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from .cache import LRUCache
+from .grading import AnswerKey, grade_submission
+from .metrics import time_stage
+from .progress_storage import ProgressStorage, create_storage
+
+DEFAULT_STUDENT = 'default'
+STUDENT_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
 
 class ProgressTracker:
-    """Tracks student progress, quiz scores, and learning analytics."""
+    """Tracks student progress, quiz scores, and learning analytics.
 
-    def __init__(self, data_dir: str = None):
+    Records are kept by a storage backend: ``'json'`` (an append-only event
+    log plus snapshot, the default) or ``'sqlite'`` (indexed tables in
+    ``progress.db``, for long histories). The backend is picked with the
+    ``backend`` argument or the ``PROGRESS_BACKEND`` environment variable.
+    """
+
+    def __init__(self, data_dir: str = None, snapshot_interval: int = 200, backend=None):
         if data_dir is None:
             self.data_dir = Path(__file__).parent.parent / "data"
         else:
             self.data_dir = Path(data_dir)
 
-        self.data_dir.mkdir(exist_ok=True)
-        self.progress_file = self.data_dir / "progress.json"
-        self.progress_data = self._load_progress()
-
-    def _load_progress(self) -> Dict:
-        """Load progress data from JSON file."""
-        if self.progress_file.exists():
-            try:
-                with open(self.progress_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading progress: {e}")
-                return self._initialize_progress_data()
-        else:
-            return self._initialize_progress_data()
-
-    def _initialize_progress_data(self) -> Dict:
-        """Initialize empty progress data structure."""
-        return {
-            'quizzes': [],
-            'flashcard_sessions': [],
-            'topics_studied': {},
-            'overall_stats': {
-                'total_quizzes': 0,
-                'total_questions_answered': 0,
-                'total_correct': 0,
-                'average_score': 0,
-                'study_time_minutes': 0
-            }
-        }
-
-    def _save_progress(self):
-        """Save progress data to JSON file."""
-        try:
-            with open(self.progress_file, 'w') as f:
-                json.dump(self.progress_data, f, indent=2)
-        except Exception as e:
-            print(f"Error saving progress: {e}")
-
-    def record_quiz(self, subject: str, topic: str, difficulty: str, questions: List[Dict], answers: List[str], time_taken_seconds: int):
-        """Record a completed quiz."""
-        # Calculate score
-        correct_count = 0
-        total_questions = len(questions)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
 
-        for i, question in enumerate(questions):
-            if i < len(answers):
-                user_answer = answers[i].strip().lower()
-                correct_answer = str(question.get('answer', '')).strip().lower()
-
-                # Basic answer matching (can be improved)
-                if user_answer == correct_answer or user_answer in correct_answer:
-                    correct_count += 1
-
-        score_percentage = (correct_count / total_questions * 100) if total_questions > 0 else 0
+        if isinstance(backend, ProgressStorage):
+            self.storage = backend
+        else:
+            backend = backend or os.getenv('PROGRESS_BACKEND', 'json')
+            self.storage = create_storage(backend.lower(), self.data_dir, snapshot_interval)
+
+    def record_quiz(self, subject: str, topic: str, difficulty: str, questions: List[Dict], answers: List[str], time_taken_seconds: int,
+                    answer_key: Optional[AnswerKey] = None):
+        """Record a completed quiz.
+
+        ``answer_key`` is the quiz's pre-normalized key, if one was cached
+        when the quiz was generated.
+        """
+        with time_stage('grading'):
+            graded = grade_submission(questions, answers, answer_key)
+        total_questions = graded.total_questions
+        correct_count = graded.correct_count
+        score_percentage = graded.score_percentage
 
         # Create quiz record
         quiz_record = {
@@ -84,50 +64,14 @@ class ProgressTracker:
                     'question': q['question'],
                     'user_answer': answers[i] if i < len(answers) else '',
                     'correct_answer': q.get('answer', ''),
-                    'was_correct': i < len(answers) and answers[i].strip().lower() in str(q.get('answer', '')).strip().lower()
+                    'was_correct': graded.results[i]
                 }
                 for i, q in enumerate(questions)
             ]
         }
 
-        # Add to quiz history
-        self.progress_data['quizzes'].append(quiz_record)
-
-        # Update topic stats
-        topic_key = f"{subject}_{topic}"
-        if topic_key not in self.progress_data['topics_studied']:
-            self.progress_data['topics_studied'][topic_key] = {
-                'subject': subject,
-                'topic': topic,
-                'times_studied': 0,
-                'total_questions': 0,
-                'total_correct': 0,
-                'average_score': 0,
-                'last_studied': None
-            }
-
-        topic_stats = self.progress_data['topics_studied'][topic_key]
-        topic_stats['times_studied'] += 1
-        topic_stats['total_questions'] += total_questions
-        topic_stats['total_correct'] += correct_count
-        topic_stats['average_score'] = round(
-            (topic_stats['total_correct'] / topic_stats['total_questions'] * 100),
-            2
-        )
-        topic_stats['last_studied'] = quiz_record['timestamp']
-
-        # Update overall stats
-        overall = self.progress_data['overall_stats']
-        overall['total_quizzes'] += 1
-        overall['total_questions_answered'] += total_questions
-        overall['total_correct'] += correct_count
-        overall['average_score'] = round(
-            (overall['total_correct'] / overall['total_questions_answered'] * 100) if overall['total_questions_answered'] > 0 else 0,
-            2
-        )
-        overall['study_time_minutes'] += round(time_taken_seconds / 60, 2)
-
-        self._save_progress()
+        with time_stage('progress_write'):
+            self.storage.add_quiz(quiz_record)
         return quiz_record
 
     def record_flashcard_session(self, subject: str, topic: str, cards_reviewed: int, time_taken_seconds: int):
@@ -140,86 +84,87 @@ class ProgressTracker:
             'time_taken_seconds': time_taken_seconds
         }
 
-        self.progress_data['flashcard_sessions'].append(session)
-
-        # Update overall study time
-        self.progress_data['overall_stats']['study_time_minutes'] += round(time_taken_seconds / 60, 2)
-
-        self._save_progress()
+        with time_stage('progress_write'):
+            self.storage.add_flashcard_session(session)
         return session
 
     def get_overall_stats(self) -> Dict:
         """Get overall statistics."""
-        return self.progress_data['overall_stats']
+        return self.storage.overall_stats()
 
     def get_topic_stats(self, subject: str = None, topic: str = None) -> Dict:
         """Get statistics for specific topic or all topics."""
         if subject and topic:
-            topic_key = f"{subject}_{topic}"
-            return self.progress_data['topics_studied'].get(topic_key, {})
+            return self.storage.topic_stats(subject, topic)
         else:
-            return self.progress_data['topics_studied']
+            return self.storage.all_topic_stats()
 
     def get_recent_quizzes(self, limit: int = 10) -> List[Dict]:
         """Get recent quiz results."""
-        quizzes = self.progress_data['quizzes']
-        return sorted(quizzes, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        return self.storage.recent_quizzes(limit)
 
     def get_quiz_history_by_topic(self, subject: str, topic: str) -> List[Dict]:
         """Get quiz history for a specific topic."""
-        return [
-            quiz for quiz in self.progress_data['quizzes']
-            if quiz['subject'] == subject and quiz['topic'] == topic
-        ]
+        return self.storage.quiz_history(subject, topic)
 
     def get_performance_trend(self, subject: str = None, topic: str = None, days: int = 30) -> List[Dict]:
         """Get performance trend over time."""
-        from datetime import datetime, timedelta
-
         cutoff_date = datetime.now() - timedelta(days=days)
-
-        quizzes = self.progress_data['quizzes']
-
-        # Filter by date and optionally by subject/topic
-        filtered = [
-            q for q in quizzes
-            if datetime.fromisoformat(q['timestamp']) >= cutoff_date
-            and (not subject or q['subject'] == subject)
-            and (not topic or q['topic'] == topic)
-        ]
-
-        # Sort by date
-        return sorted(filtered, key=lambda x: x['timestamp'])
+        return self.storage.quizzes_since(cutoff_date.isoformat(), subject, topic)
 
     def get_strengths_and_weaknesses(self) -> Dict:
         """Analyze strengths and weaknesses across topics."""
-        topics = self.progress_data['topics_studied']
-
-        if not topics:
-            return {'strengths': [], 'weaknesses': [], 'needs_review': []}
-
-        # Sort topics by performance
-        sorted_topics = sorted(
-            topics.values(),
-            key=lambda x: x.get('average_score', 0),
-            reverse=True
-        )
-
-        # Categorize
-        strengths = [t for t in sorted_topics if t.get('average_score', 0) >= 80]
-        weaknesses = [t for t in sorted_topics if t.get('average_score', 0) < 60]
-        needs_review = [t for t in sorted_topics if 60 <= t.get('average_score', 0) < 80]
-
-        return {
-            'strengths': strengths[:5],
-            'weaknesses': weaknesses[:5],
-            'needs_review': needs_review[:5]
-        }
+        return self.storage.strengths_and_weaknesses(limit=5)
 
     def reset_progress(self):
         """Reset all progress data (use with caution)."""
-        self.progress_data = self._initialize_progress_data()
-        self._save_progress()
+        self.storage.reset()
+
+
+class ProgressRegistry:
+    """One ProgressTracker per student, each in its own data directory.
+
+    The ``'default'`` student uses the data directory itself, so progress
+    recorded before students existed stays with it; every other student
+    gets ``students/<student_id>/``. Only the ``max_students`` most recently
+    used trackers stay in memory, so a stats request loads one student's
+    history and memory stays bounded however many students there are.
+    """
+
+    def __init__(self, data_dir: str = None, max_students: int = 64, snapshot_interval: int = 200, backend: str = None):
+        if data_dir is None:
+            self.data_dir = Path(__file__).parent.parent / "data"
+        else:
+            self.data_dir = Path(data_dir)
+
+        self.snapshot_interval = snapshot_interval
+        self.backend = backend
+        # Public so its hit rate can be reported
+        self.trackers = LRUCache(max_entries=max_students)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_valid_student_id(student_id: str) -> bool:
+        return bool(student_id) and STUDENT_ID_PATTERN.fullmatch(student_id) is not None
+
+    def student_dir(self, student_id: str) -> Path:
+        if student_id == DEFAULT_STUDENT:
+            return self.data_dir
+        return self.data_dir / "students" / student_id
+
+    def get(self, student_id: str = DEFAULT_STUDENT) -> ProgressTracker:
+        """The tracker for a student, loading it from disk if it isn't in memory."""
+        if not self.is_valid_student_id(student_id):
+            raise ValueError(f"Invalid student id: {student_id!r}")
+
+        tracker = self.trackers.get(student_id)
+        if tracker is None:
+            with self._lock:
+                tracker = self.trackers.get(student_id)
+                if tracker is None:
+                    tracker = ProgressTracker(self.student_dir(student_id), self.snapshot_interval, self.backend)
+                    self.trackers.set(student_id, tracker)
+        return tracker
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderHealth:
+    """Circuit breaker and latency record for one AI provider.
+
+    After ``failure_threshold`` consecutive failed calls the circuit opens:
+    ``allow`` refuses every call for ``reset_seconds``, so requests go to
+    local generation at once instead of waiting for another failure. Then
+    one trial call is let through (half open); its success closes the
+    circuit, its failure opens it for another ``reset_seconds``. A trial
+    that never reports back is replaced after ``reset_seconds``.
+
+    Latencies of the last ``window`` successful calls are kept for the
+    percentiles in ``status``.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 30.0, window: int = 200):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._consecutive_failures = 0
+        self._last_error = None
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return self._state
+
+    def available(self) -> bool:
+        """Whether a call would be allowed now (without claiming the half-open trial)."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                return self._trial_started is None or now - self._trial_started >= self.reset_seconds
+            return False
+
+    def allow(self) -> bool:
+        """Claim permission for one call; in half-open state only one trial runs at a time."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                if self._trial_started is None or now - self._trial_started >= self.reset_seconds:
+                    self._state = HALF_OPEN
+                    self._trial_started = now
+                    return True
+            return False
+
+    def record_success(self, latency_seconds: float):
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency_seconds)
+            self._consecutive_failures = 0
+            self._state = CLOSED
+            self._trial_started = None
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self._consecutive_failures += 1
+            self._last_error = f"{type(error).__name__}: {error}"
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        """p50/p95/p99 latency in milliseconds (nearest rank), None before the first call."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        result = {}
+        for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            if latencies:
+                rank = max(0, math.ceil(fraction * len(latencies)) - 1)
+                result[name] = round(latencies[rank] * 1000, 1)
+            else:
+                result[name] = None
+        return result
+
+    def status(self) -> Dict:
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            status = {
+                'state': state,
+                'calls': self.calls,
+                'failures': self.failures,
+                'consecutive_failures': self._consecutive_failures,
+                'last_error': self._last_error
+            }
+        status['latency_ms'] = self.percentiles()
+        return status
+
+
+if __name__ == "__main__":
+    health = ProviderHealth(failure_threshold=3, reset_seconds=0.2)
+    for latency in (0.12, 0.34, 0.08, 0.51, 0.2):
+        health.record_success(latency)
+    print("Healthy:", health.status())
+
+    for _ in range(3):
+        health.record_failure(TimeoutError("read timed out"))
+    print(f"After 3 failures: {health.state}, allow={health.allow()}")
+
+    time.sleep(0.25)
+    print(f"After {health.reset_seconds}s: {health.state}, trial allowed={health.allow()}, "
+          f"second call allowed={health.allow()}")
+    health.record_failure(ConnectionError("connection refused"))
+    print(f"Trial failed: {health.state}")
+
+    time.sleep(0.25)
+    health.allow()
+    health.record_success(0.15)
+    print(f"Trial succeeded: {health.state}, {health.status()['latency_ms']}")
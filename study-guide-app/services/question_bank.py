@@ -0,0 +1,409 @@
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import CacheCounter
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process file lock, so run a single worker there
+    fcntl = None
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+FLASHCARDS = 'flashcards'
+
+
+class RateLimiter:
+    """Token bucket: at most ``per_minute`` acquisitions per minute, in small bursts."""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.interval = 60.0 / per_minute
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stopped: threading.Event) -> bool:
+        """Wait for a token. Returns False if ``stopped`` was set while waiting."""
+        while not stopped.is_set():
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) * self.interval
+            stopped.wait(wait)
+        return False
+
+
+class QuestionBank:
+    """Pre-generated AI question banks and flashcard decks for every topic.
+
+    A deck is generated for each (subject, topic, kind), where kind is a
+    difficulty or 'flashcards', and stored on disk together with the topic
+    version it was generated from. Requests are answered from the bank;
+    a deck whose topic changed is no longer served and is queued for
+    regeneration. A scheduler thread polls the scanner's index version and
+    queues every new or changed topic, so content edits are picked up
+    automatically.
+
+    A worker takes up to ``batch_size`` queued decks at once and generates
+    them with APIQuestionGenerator.generate_batch, so a topic's decks
+    usually cost one provider call. Workers share a rate limiter so the
+    provider sees at most ``requests_per_minute`` calls, and a failed deck
+    is retried with exponential backoff up to ``max_attempts`` times.
+
+    Several server processes (e.g. gunicorn workers) can share a bank
+    directory: only the process holding ``generator.lock`` in it runs the
+    workers and calls the provider. The others serve the decks it writes,
+    re-reading the directory when it changes, and take over generation if
+    that process exits.
+    """
+
+    def __init__(self, scanner, generator, bank_dir: str = None, workers: int = 2,
+                 requests_per_minute: float = 20, max_attempts: int = 4, backoff_seconds: float = 2.0,
+                 question_count: int = 20, flashcard_count: int = 15, poll_seconds: float = 5.0,
+                 batch_size: int = 8):
+        if bank_dir is None:
+            self.bank_dir = Path(__file__).parent.parent / "data" / "question_bank"
+        else:
+            self.bank_dir = Path(bank_dir)
+
+        self.scanner = scanner
+        self.generator = generator
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.question_count = question_count
+        self.flashcard_count = flashcard_count
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(requests_per_minute)
+
+        # (subject, topic, kind) -> {'version': ..., 'items': [...]}
+        self._decks: Dict[Tuple[str, str, str], Dict] = {}
+        # Requests served from a current deck (hit) or not (miss)
+        self.deck_stats = CacheCounter(size=lambda: len(self._decks))
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        # Jobs waiting or running, so a deck is never generated twice at once
+        self._queued = set()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._index_version = None
+        # Whether this process holds generator.lock and generates decks
+        self.generating = False
+        self._lock_file = None
+        self._bank_dir_mtime = None
+        self.generated = 0
+        self.failed = 0
+
+        self._load()
+
+    def start(self):
+        """Start the scheduler, and the worker pool if no other process is generating."""
+        self._stopped.clear()
+        if self._claim_generator():
+            self._start_workers()
+        scheduler = threading.Thread(target=self._poll, name='question-bank-scheduler', daemon=True)
+        scheduler.start()
+        self._threads.append(scheduler)
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.generating = False
+        if self._lock_file is not None:
+            # Closing the file releases the lock for another process
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _claim_generator(self) -> bool:
+        """Take generator.lock without waiting; True if this process now generates decks."""
+        if fcntl is None:
+            return True
+        try:
+            self.bank_dir.mkdir(parents=True, exist_ok=True)
+            lock_file = open(self.bank_dir / "generator.lock", 'a')
+        except OSError as e:
+            print(f"Error opening question bank lock: {e}")
+            return False
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _start_workers(self):
+        """Queue every missing or outdated deck and start the worker pool."""
+        self.generating = True
+        # Decks written by a previous generating process
+        self._load()
+        self.refresh()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'question-bank-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def get_questions(self, subject: str, topic_data: Dict, difficulty: str, count: int) -> Optional[List[Dict]]:
+        """``count`` banked questions for the topic's current version, or None."""
+        items = self._get(subject, topic_data, difficulty)
+        if items is None or len(items) < count:
+            return None
+        return random.sample(items, count)
+
+    def get_flashcards(self, subject: str, topic_data: Dict) -> Optional[List[Dict]]:
+        """The banked flashcard deck for the topic's current version, or None."""
+        return self._get(subject, topic_data, FLASHCARDS)
+
+    def _get(self, subject: str, topic_data: Dict, kind: str) -> Optional[List[Dict]]:
+        key = (subject, topic_data['title'], kind)
+        with self._lock:
+            deck = self._decks.get(key)
+        hit = deck is not None and deck['version'] == topic_data['version']
+        self.deck_stats.record(hit)
+        if hit:
+            return deck['items']
+        if kind == FLASHCARDS or kind in DIFFICULTIES:
+            # Missing or outdated, e.g. the file changed before the next poll
+            self._enqueue(key, 1)
+        return None
+
+    def refresh(self):
+        """Queue decks for new and changed topics and forget removed ones."""
+        self._index_version = self.scanner.index_version
+        subjects = self.scanner.scan_subjects()
+        current = set()
+        for subject, topics in subjects.items():
+            for topic in topics:
+                for kind in DIFFICULTIES + (FLASHCARDS,):
+                    key = (subject, topic['title'], kind)
+                    current.add(key)
+                    with self._lock:
+                        deck = self._decks.get(key)
+                    if deck is None or deck['version'] != topic['version']:
+                        self._enqueue(key, 1)
+
+        with self._lock:
+            removed = [key for key in self._decks if key not in current]
+            for key in removed:
+                del self._decks[key]
+        for key in removed:
+            self._remove(key)
+
+    def status(self) -> Dict:
+        with self._lock:
+            decks = len(self._decks)
+            pending = len(self._queued)
+            generated, failed = self.generated, self.failed
+        return {'decks': decks, 'pending': pending, 'generated': generated, 'failed': failed,
+                'generating': self.generating}
+
+    def _enqueue(self, key: Tuple[str, str, str], attempt: int):
+        if not self.generating:
+            # Another process generates; its decks are picked up by _poll
+            return
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self._jobs.put((key, attempt))
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_seconds):
+            try:
+                if not self.generating:
+                    if self._claim_generator():
+                        self._start_workers()
+                    else:
+                        self._reload_if_changed()
+                elif self.scanner.index_version != self._index_version:
+                    self.refresh()
+            except Exception as e:
+                print(f"Error refreshing question bank: {e}")
+
+    def _reload_if_changed(self):
+        """Re-read the decks after the generating process wrote or removed one."""
+        try:
+            mtime = self.bank_dir.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._bank_dir_mtime:
+            self._bank_dir_mtime = mtime
+            self._load()
+
+    def _work(self):
+        while not self._stopped.is_set():
+            try:
+                jobs = [self._jobs.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            # Take whatever else is waiting, to generate it in one batched call
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._run(jobs)
+            finally:
+                for _ in jobs:
+                    self._jobs.task_done()
+
+    def _run(self, jobs: List[Tuple[Tuple[str, str, str], int]]):
+        todo = []
+        for key, attempt in jobs:
+            subject, title, kind = key
+            topic_data = self.scanner.get_topic_content(subject, title)
+            with self._lock:
+                deck = self._decks.get(key)
+            if topic_data is None or (deck is not None and deck['version'] == topic_data['version']):
+                # Topic removed, or already up to date
+                with self._lock:
+                    self._queued.discard(key)
+                continue
+            todo.append((key, attempt, topic_data))
+        if not todo:
+            return
+
+        requests = []
+        for (subject, title, kind), _, topic_data in todo:
+            if kind == FLASHCARDS:
+                requests.append({'topic_data': topic_data, 'kind': 'flashcards', 'count': self.flashcard_count})
+            else:
+                requests.append({'topic_data': topic_data, 'kind': 'questions', 'difficulty': kind,
+                                 'count': self.question_count})
+        try:
+            # Every provider call of the batch waits for the rate limiter
+            results = self.generator.generate_batch(
+                requests, throttle=lambda: self.rate_limiter.acquire(self._stopped)
+            )
+        except Exception as e:
+            print(f"Error generating question bank batch: {e}")
+            results = [[] for _ in todo]
+
+        for (key, attempt, topic_data), items in zip(todo, results):
+            if items:
+                self._store(key, {'version': topic_data['version'], 'items': items})
+                with self._lock:
+                    self.generated += 1
+                    self._queued.discard(key)
+            elif self._stopped.is_set():
+                with self._lock:
+                    self._queued.discard(key)
+            elif attempt < self.max_attempts:
+                # Back off 2s, 4s, 8s... with jitter, without holding a worker
+                delay = self.backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                timer = threading.Timer(delay, self._retry, (key, attempt + 1))
+                timer.daemon = True
+                timer.start()
+            else:
+                print(f"Giving up on {key[2]} for {key[1]} after {attempt} attempts")
+                with self._lock:
+                    self.failed += 1
+                    self._queued.discard(key)
+
+    def _retry(self, key: Tuple[str, str, str], attempt: int):
+        if not self._stopped.is_set():
+            self._jobs.put((key, attempt))
+
+    def _deck_path(self, key: Tuple[str, str, str]) -> Path:
+        name = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()[:32]
+        return self.bank_dir / f"{name}.json"
+
+    def _store(self, key: Tuple[str, str, str], deck: Dict):
+        with self._lock:
+            self._decks[key] = deck
+        path = self._deck_path(key)
+        try:
+            self.bank_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'key': list(key), **deck}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving question bank deck: {e}")
+
+    def _remove(self, key: Tuple[str, str, str]):
+        try:
+            self._deck_path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _load(self):
+        if not self.bank_dir.exists():
+            return
+        decks = {}
+        for path in self.bank_dir.glob('*.json'):
+            try:
+                with open(path, 'r') as f:
+                    deck = json.load(f)
+                decks[tuple(deck['key'])] = {'version': deck['version'], 'items': deck['items']}
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading question bank deck {path.name}: {e}")
+        with self._lock:
+            self._decks = decks
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from .api_question_generator import APIQuestionGenerator
+    from .content_scanner import ContentScanner
+
+    class FlakyGenerator(APIQuestionGenerator):
+        """Stub provider whose every third call fails."""
+
+        def _request(self, system_prompt, prompt, max_tokens):
+            if self.api_calls % 3 == 1:
+                raise RuntimeError("simulated provider error")
+            return super()._request(system_prompt, prompt, max_tokens)
+
+    scanner = ContentScanner()
+    generator = FlakyGenerator(provider='stub')
+    with tempfile.TemporaryDirectory() as tmp:
+        bank = QuestionBank(scanner, generator, bank_dir=tmp, workers=3,
+                            requests_per_minute=600, backoff_seconds=0.2)
+        # Another server process over the same directory (a second lock holder
+        # in this process behaves the same way)
+        follower_generator = APIQuestionGenerator(provider='stub')
+        follower = QuestionBank(scanner, follower_generator, bank_dir=tmp, poll_seconds=0.1)
+        start = time.perf_counter()
+        bank.start()
+        follower.start()
+        while bank.status()['pending']:
+            time.sleep(0.05)
+        print(f"Filled bank in {time.perf_counter() - start:.2f}s: {bank.status()}, API calls: {generator.api_calls}")
+
+        subject, topics = next(iter(scanner.scan_subjects().items()))
+        topic_data = scanner.get_topic_content(subject, topics[0]['title'])
+        start = time.perf_counter()
+        questions = bank.get_questions(subject, topic_data, 'medium', 10)
+        print(f"Served {len(questions)} banked questions in {(time.perf_counter() - start) * 1e6:.0f}us")
+
+        time.sleep(0.3)
+        print(f"Second process: {follower.status()}, API calls: {follower_generator.api_calls}, "
+              f"serves banked questions: {follower.get_questions(subject, topic_data, 'medium', 10) is not None}")
+        bank.stop()
+        time.sleep(0.3)
+        print(f"After the first process stopped: generating={follower.status()['generating']}, "
+              f"API calls: {follower_generator.api_calls}")
+        follower.stop()
+
+        # A second bank over the same directory starts full
+        reloaded = QuestionBank(scanner, generator, bank_dir=tmp)
+        reloaded.refresh()
+        print(f"Reloaded: {reloaded.status()}")
@@ -1,11 +1,24 @@
 import re
 import random
-from typing import List, Dict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .extractors import SectionIndex, extract_facts, index_topic
+from .metrics import CacheCounter, time_stage
+
+
+class FillBlankCandidate(NamedTuple):
+    """A sentence that can become a fill-in-the-blank question."""
+    sentence: str
+    important_words: List[str]
+
 
 class LocalQuestionGenerator:
     """Generates questions from content using pattern matching and templates."""
 
     def __init__(self):
+        # (topic, difficulty) -> (topic version, question pool)
+        self._pool_cache: Dict[Tuple, Tuple[str, Tuple[List, List]]] = {}
+        self.pool_cache_stats = CacheCounter(size=lambda: len(self._pool_cache))
         self.question_templates = {
             'who': [
                 "Who was {entity}?",
@@ -41,8 +54,51 @@ class LocalQuestionGenerator:
             ]
         }
 
-    def generate_questions(self, topic_data: Dict, difficulty: str = 'medium', count: int = 10) -> List[Dict]:
-        """Generate questions based on topic content and difficulty."""
+    def generate_questions(self, topic_data: Dict, difficulty: str = 'medium', count: int = 10,
+                           seed=None) -> List[Dict]:
+        """Generate questions based on topic content and difficulty.
+
+        With a seed the same topic version, difficulty and count always
+        produce the same questions; without one every call is random.
+        """
+        with time_stage('generate_local'):
+            return list(self._draw(topic_data, difficulty, count, seed))
+
+    def iter_questions(self, topic_data: Dict, difficulty: str = 'medium', count: int = 10,
+                       seed=None) -> Iterator[Dict]:
+        """Yield the questions generate_questions would return, one at a time.
+
+        Only the pool lookup and the draw happen up front; each question is
+        built when it is requested, so the first one is ready as soon as
+        the topic's question pool is (cached per topic version).
+        """
+        with time_stage('generate_local'):
+            return self._draw(topic_data, difficulty, count, seed)
+
+    def _draw(self, topic_data: Dict, difficulty: str, count: int, seed) -> Iterator[Dict]:
+        rng = random.Random(seed)
+        pool = self._get_question_pool(topic_data, difficulty)
+        return self._iter_sample(pool, count, rng)
+
+    def _get_question_pool(self, topic_data: Dict, difficulty: str) -> Tuple[List, List]:
+        """Return the (prioritized, others) candidate pool, cached per topic version."""
+        version = topic_data.get('version')
+        cache_key = (topic_data.get('file_path') or topic_data.get('title'), difficulty)
+
+        if version is not None:
+            cached = self._pool_cache.get(cache_key)
+            hit = cached is not None and cached[0] == version
+            self.pool_cache_stats.record(hit)
+            if hit:
+                return cached[1]
+
+        pool = self._build_question_pool(topic_data, difficulty)
+        if version is not None:
+            self._pool_cache[cache_key] = (version, pool)
+        return pool
+
+    def _build_question_pool(self, topic_data: Dict, difficulty: str) -> Tuple[List, List]:
+        """Build every candidate question for a topic, split by difficulty priority."""
         questions = []
 
         # Use embedded quiz questions first
@@ -55,15 +111,27 @@ class LocalQuestionGenerator:
 
         # Generate from sections
         if topic_data.get('sections'):
-            questions.extend(self._generate_from_sections(topic_data['sections'], difficulty))
+            questions.extend(self._generate_from_sections(
+                topic_data['sections'], difficulty, self._get_topic_index(topic_data)
+            ))
+
+        return self._split_by_priority(questions, difficulty)
 
-        # Shuffle and limit to requested count
-        random.shuffle(questions)
+    def _iter_sample(self, pool: Tuple[List, List], count: int, rng: random.Random) -> Iterator[Dict]:
+        """Draw ``count`` questions, prioritized types first, each group in random order.
 
-        # Adjust based on difficulty
-        questions = self._adjust_for_difficulty(questions, difficulty)
+        Same distribution as shuffling the whole pool and keeping the first
+        ``count`` after prioritizing, without touching the rest of the pool.
+        """
+        prioritized, others = pool
+        count = max(count, 0)
 
-        return questions[:count]
+        picked = rng.sample(prioritized, min(count, len(prioritized)))
+        if len(picked) < count:
+            picked.extend(rng.sample(others, min(count - len(picked), len(others))))
+
+        for candidate in picked:
+            yield self._fill_in_blank(candidate, rng) if isinstance(candidate, FillBlankCandidate) else dict(candidate)
 
     def _format_quiz_questions(self, quiz_questions: List[Dict]) -> List[Dict]:
         """Format embedded quiz questions."""
@@ -96,7 +164,7 @@ class LocalQuestionGenerator:
             })
 
             # Extract specific facts for more detailed questions
-            facts = self._extract_facts(definition)
+            facts = extract_facts(definition)
             for fact in facts:
                 if difficulty in ['medium', 'hard']:
                     questions.append({
@@ -109,34 +177,40 @@ class LocalQuestionGenerator:
 
             # Create fill-in-the-blank for hard questions
             if difficulty == 'hard' and len(definition.split()) > 10:
-                blank_question = self._create_fill_blank(term, definition)
-                if blank_question:
-                    questions.append(blank_question)
+                blank_candidate = self._fill_blank_candidate(definition)
+                if blank_candidate:
+                    questions.append(blank_candidate)
 
         return questions
 
-    def _generate_from_sections(self, sections: List[Dict], difficulty: str) -> List[Dict]:
+    def _get_topic_index(self, topic_data: Dict) -> List[SectionIndex]:
+        """Entity/date/achievement index for a topic's sections, memoized on scanner records."""
+        build = lambda topic: index_topic(topic['sections'])
+        if hasattr(topic_data, 'derived'):
+            return topic_data.derived('section_index', build)
+        return build(topic_data)
+
+    def _generate_from_sections(self, sections: List[Dict], difficulty: str,
+                                index: List[SectionIndex] = None) -> List[Dict]:
         """Generate questions from content sections."""
         questions = []
 
-        for section in sections:
-            section_title = section['title']
-            content = section['content']
-
-            # Extract entities (proper nouns, key figures)
-            entities = self._extract_entities(content)
+        if index is None:
+            index = index_topic(sections)
 
-            # Extract dates and events
-            dates = self._extract_dates(content)
+        for section, section_index in zip(sections, index):
+            section_title = section['title']
 
-            # Extract achievements and important facts
-            achievements = self._extract_achievements(content)
+            # Entities (proper nouns, key figures), dates and achievements
+            entities = section_index.entities()
+            dates = section_index.dates()
+            achievements = section_index.achievements
 
             # Generate who/what/when questions
             for entity in entities[:3]:  # Limit per section
                 questions.append({
                     'question': f"Who/What was {entity}?",
-                    'answer': self._find_context(entity, content),
+                    'answer': section_index.entity_context(entity),
                     'type': 'identification',
                     'difficulty': 'easy',
                     'section': section_title
@@ -162,83 +236,12 @@ class LocalQuestionGenerator:
 
         return questions
 
-    def _extract_facts(self, text: str) -> List[str]:
-        """Extract factual statements from text."""
-        facts = []
-
-        # Look for bullet points
-        bullets = re.findall(r'[-•]\s*(.+?)(?=\n|$)', text)
-        facts.extend([b.strip() for b in bullets if len(b.strip()) > 20])
-
-        # Look for sentences with achievements
-        achievement_pattern = r'(created|built|founded|conquered|developed|invented)\s+(.+?)(?=[.!?\n])'
-        matches = re.findall(achievement_pattern, text, re.IGNORECASE)
-        facts.extend([f"{verb} {obj}" for verb, obj in matches])
-
-        return facts[:5]  # Limit facts
-
-    def _extract_entities(self, text: str) -> List[str]:
-        """Extract proper nouns and key entities."""
-        # Look for capitalized words/phrases (2-4 words)
-        entity_pattern = r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b'
-        entities = re.findall(entity_pattern, text)
-
-        # Filter out common words and very short entities
-        filtered = [e for e in entities if len(e) > 3 and e not in ['The', 'This', 'That', 'These', 'Those']]
-
-        return list(set(filtered))[:10]  # Unique entities, limited
-
-    def _extract_dates(self, text: str) -> List[tuple]:
-        """Extract dates and associated events."""
-        dates = []
+    def _fill_blank_candidate(self, definition: str) -> Optional[FillBlankCandidate]:
+        """Find a sentence suitable for a fill-in-the-blank question.
 
-        # Pattern for dates like "1792 BCE", "490 BC", "c. 2300 BC"
-        date_pattern = r'(c\.\s*)?(\d{1,4}(?:\s*-\s*\d{1,4})?)\s*(BCE?|CE?|BC|AD)'
-
-        # Find dates with context
-        matches = re.finditer(date_pattern, text)
-        for match in matches:
-            date = match.group(0)
-            # Get surrounding context (50 chars before and after)
-            start = max(0, match.start() - 50)
-            end = min(len(text), match.end() + 50)
-            context = text[start:end].strip()
-
-            dates.append((date, context))
-
-        return dates[:5]
-
-    def _extract_achievements(self, text: str) -> List[Dict]:
-        """Extract achievements and accomplishments."""
-        achievements = []
-
-        # Look for achievement markers
-        achievement_markers = ['created', 'built', 'founded', 'conquered', 'developed', 'invented', 'established']
-
-        for marker in achievement_markers:
-            pattern = rf'(\w+(?:\s+\w+){{0,2}})\s+{marker}\s+(.+?)(?=[.!?\n])'
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for subject, detail in matches:
-                achievements.append({
-                    'subject': subject.strip(),
-                    'action': marker,
-                    'detail': detail.strip()[:100]
-                })
-
-        return achievements[:5]
-
-    def _find_context(self, entity: str, text: str, window: int = 100) -> str:
-        """Find contextual information about an entity."""
-        # Find the entity in text and return surrounding context
-        match = re.search(re.escape(entity), text)
-        if match:
-            start = max(0, match.start() - window)
-            end = min(len(text), match.end() + window)
-            return text[start:end].strip()
-        return ""
-
-    def _create_fill_blank(self, term: str, definition: str) -> Dict:
-        """Create a fill-in-the-blank question."""
+        The word to blank out is chosen when the question is drawn from the
+        pool, so repeated quizzes blank different words.
+        """
         # Find a sentence with the term
         sentences = re.split(r'[.!?]', definition)
 
@@ -250,20 +253,24 @@ class LocalQuestionGenerator:
                 important_words = [w for w in words if len(w) > 5 or w[0].isupper()]
 
                 if important_words:
-                    word_to_blank = random.choice(important_words)
-                    question_text = sentence.replace(word_to_blank, '______')
-
-                    return {
-                        'question': f"Fill in the blank: {question_text}",
-                        'answer': word_to_blank.strip('.,!?'),
-                        'type': 'fill_blank',
-                        'difficulty': 'hard'
-                    }
+                    return FillBlankCandidate(sentence, important_words)
 
         return None
 
-    def _adjust_for_difficulty(self, questions: List[Dict], difficulty: str) -> List[Dict]:
-        """Filter and adjust questions based on difficulty level."""
+    def _fill_in_blank(self, candidate: FillBlankCandidate, rng: random.Random) -> Dict:
+        """Create a fill-in-the-blank question from a candidate sentence."""
+        word_to_blank = rng.choice(candidate.important_words)
+        question_text = candidate.sentence.replace(word_to_blank, '______')
+
+        return {
+            'question': f"Fill in the blank: {question_text}",
+            'answer': word_to_blank.strip('.,!?'),
+            'type': 'fill_blank',
+            'difficulty': 'hard'
+        }
+
+    def _split_by_priority(self, questions: List, difficulty: str) -> Tuple[List, List]:
+        """Split questions into those whose type suits the difficulty level and the rest."""
         if difficulty == 'easy':
             # Prefer definition and identification questions
             priority_types = ['definition', 'identification', 'embedded']
@@ -274,14 +281,22 @@ class LocalQuestionGenerator:
             # Prefer complex questions
             priority_types = ['fill_blank', 'significance', 'fact']
 
-        # Sort questions to prioritize certain types
-        prioritized = [q for q in questions if q.get('type') in priority_types]
-        others = [q for q in questions if q.get('type') not in priority_types]
+        prioritized = [q for q in questions if self._question_type(q) in priority_types]
+        others = [q for q in questions if self._question_type(q) not in priority_types]
 
-        return prioritized + others
+        return prioritized, others
+
+    def _question_type(self, candidate) -> Optional[str]:
+        if isinstance(candidate, FillBlankCandidate):
+            return 'fill_blank'
+        return candidate.get('type')
 
     def generate_flashcards(self, topic_data: Dict) -> List[Dict]:
         """Generate flashcards from key terms."""
+        with time_stage('generate_local'):
+            return self._generate_flashcards(topic_data)
+
+    def _generate_flashcards(self, topic_data: Dict) -> List[Dict]:
         flashcards = []
 
         if topic_data.get('key_terms'):
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+
+class ResponseCache:
+    """Disk-backed cache of generated questions and flashcards.
+
+    Entries are JSON files named by a content hash (see ``make_key``), so
+    any process serving the same data directory shares them. An entry
+    expires ``ttl_seconds`` after it was written. When there are more
+    than ``max_entries`` entries, the least recently used ones (by file
+    mtime, refreshed on every hit) are deleted.
+    """
+
+    def __init__(self, cache_dir: str = None, ttl_seconds: int = 7 * 24 * 3600, max_entries: int = 1000):
+        if cache_dir is None:
+            self.cache_dir = Path(__file__).parent.parent / "data" / "api_cache"
+        else:
+            self.cache_dir = Path(cache_dir)
+
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entry_count = None
+        # Guards hits/misses, which request threads update concurrently
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash of everything that determines a response."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """The cached value for a key, or None if missing or expired."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self._record(hit=False)
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error reading cached response {path.name}: {e}")
+            self._record(hit=False)
+            return None
+
+        if time.time() - entry.get('created', 0) > self.ttl_seconds:
+            self._remove(path)
+            self._record(hit=False)
+            return None
+
+        try:
+            # Mark as recently used for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        self._record(hit=True)
+        return entry.get('value')
+
+    def _record(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: str, value: Any):
+        """Store a value; writes are atomic so readers never see a partial entry."""
+        path = self._entry_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            existed = path.exists()
+            tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'created': time.time(), 'value': value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching response: {e}")
+            return
+
+        with self._lock:
+            if self._entry_count is None:
+                self._entry_count = len(self._entry_paths())
+            elif not existed:
+                self._entry_count += 1
+            if self._entry_count > self.max_entries:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for path in self._entry_paths():
+                self._remove(path)
+            self._entry_count = 0
+
+    def _entry_paths(self):
+        return list(self.cache_dir.glob('*/*.json'))
+
+    def _evict(self):
+        """Delete expired entries, then the least recently used down to 90% of max_entries."""
+        entries = []
+        now = time.time()
+        for path in self._entry_paths():
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+
+        entries.sort()
+        # Evict a little extra so the directory isn't rescanned on every write
+        excess = len(entries) - int(self.max_entries * 0.9)
+        kept = 0
+        for mtime, path in entries:
+            if excess > 0:
+                self._remove(path)
+                excess -= 1
+            elif now - mtime > self.ttl_seconds and self._is_expired(path, now):
+                self._remove(path)
+            else:
+                kept += 1
+        self._entry_count = kept
+
+    def _is_expired(self, path: Path, now: float) -> bool:
+        try:
+            with open(path, 'r') as f:
+                return now - json.load(f).get('created', 0) > self.ttl_seconds
+        except (OSError, ValueError):
+            return True
+
+    def _remove(self, path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
@@ -9,6 +9,8 @@ class StudyGuideApp {
         this.currentQuestionIndex = 0;
         this.quizAnswers = [];
         this.quizStartTime = null;
+        this.quizStream = null;
+        this.quizResult = null;
         this.timerInterval = null;
         this.currentFlashcards = [];
         this.currentFlashcardIndex = 0;
@@ -217,41 +219,34 @@ class StudyGuideApp {
         const count = parseInt(document.getElementById('quiz-count').value);
         const timedQuiz = document.getElementById('timed-quiz').checked;
         const generator = document.getElementById('quiz-generator').value;
+        const settings = {
+            subject: this.currentSubject,
+            topic: this.currentTopic,
+            difficulty: difficulty,
+            count: count,
+            use_api: generator !== 'local',
+            api_provider: generator
+        };
+
+        this.closeQuizStream();
+        if (window.EventSource) {
+            // Show the first question as soon as it arrives
+            this.streamQuiz(settings, timedQuiz);
+            return;
+        }
 
         // Generate questions
         try {
             const response = await fetch('/api/questions/generate', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    subject: this.currentSubject,
-                    topic: this.currentTopic,
-                    difficulty: difficulty,
-                    count: count,
-                    use_api: generator !== 'local',
-                    api_provider: generator
-                })
+                body: JSON.stringify(settings)
             });
 
             const data = await response.json();
 
             if (data.success && data.questions.length > 0) {
-                this.currentQuestions = data.questions;
-                this.quizAnswers = new Array(this.currentQuestions.length).fill('');
-                this.currentQuestionIndex = 0;
-                this.quizStartTime = Date.now();
-
-                document.getElementById('quiz-setup').classList.add('hidden');
-                document.getElementById('quiz-questions').classList.remove('hidden');
-
-                if (timedQuiz) {
-                    this.startTimer();
-                    document.getElementById('quiz-timer').classList.remove('hidden');
-                } else {
-                    document.getElementById('quiz-timer').classList.add('hidden');
-                }
-
-                this.showQuestion();
+                this.beginQuiz(data.questions, timedQuiz);
             } else {
                 alert('Failed to generate questions. Please try again.');
             }
@@ -261,10 +256,80 @@ class StudyGuideApp {
         }
     }
 
+    streamQuiz(settings, timedQuiz) {
+        const source = new EventSource(`/api/questions/stream?${new URLSearchParams(settings)}`);
+        this.quizStream = source;
+        let started = false;
+
+        source.addEventListener('question', (event) => {
+            const question = JSON.parse(event.data);
+            if (!started) {
+                started = true;
+                this.beginQuiz([question], timedQuiz);
+                return;
+            }
+            // Later questions are appended while the student works on the first ones;
+            // the answer being typed is left alone
+            this.currentQuestions.push(question);
+            this.quizAnswers.push('');
+            this.updateQuizNavigation();
+        });
+
+        source.addEventListener('done', () => {
+            this.closeQuizStream();
+            if (!started) {
+                alert('Failed to generate questions. Please try again.');
+            } else {
+                this.updateQuizNavigation();
+            }
+        });
+
+        source.onerror = () => {
+            // Also fired for error responses; don't let EventSource reconnect
+            this.closeQuizStream();
+            if (!started) {
+                alert('Error starting quiz. Please try again.');
+            } else {
+                this.updateQuizNavigation();
+            }
+        };
+    }
+
+    closeQuizStream() {
+        if (this.quizStream) {
+            this.quizStream.close();
+            this.quizStream = null;
+        }
+    }
+
+    beginQuiz(questions, timedQuiz) {
+        this.currentQuestions = questions;
+        this.quizAnswers = new Array(this.currentQuestions.length).fill('');
+        this.quizResult = null;
+        this.currentQuestionIndex = 0;
+        this.quizStartTime = Date.now();
+
+        document.getElementById('quiz-setup').classList.add('hidden');
+        document.getElementById('quiz-questions').classList.remove('hidden');
+
+        if (timedQuiz) {
+            this.startTimer();
+            document.getElementById('quiz-timer').classList.remove('hidden');
+        } else {
+            document.getElementById('quiz-timer').classList.add('hidden');
+        }
+
+        this.showQuestion();
+    }
+
     showQuestion() {
         const question = this.currentQuestions[this.currentQuestionIndex];
         document.getElementById('current-question').textContent = question.question;
         document.getElementById('answer-input').value = this.quizAnswers[this.currentQuestionIndex];
+        this.updateQuizNavigation();
+    }
+
+    updateQuizNavigation() {
         document.getElementById('quiz-question-counter').textContent =
             `Question ${this.currentQuestionIndex + 1} of ${this.currentQuestions.length}`;
 
@@ -278,6 +343,9 @@ class StudyGuideApp {
             document.getElementById('next-question-btn').classList.remove('hidden');
             document.getElementById('submit-quiz-btn').classList.add('hidden');
         }
+
+        // Only submit once every question has arrived
+        document.getElementById('submit-quiz-btn').disabled = Boolean(this.quizStream);
     }
 
     previousQuestion() {
@@ -302,6 +370,7 @@ class StudyGuideApp {
     }
 
     async submitQuiz() {
+        this.closeQuizStream();
         this.saveCurrentAnswer();
         this.stopTimer();
 
@@ -325,6 +394,7 @@ class StudyGuideApp {
             const data = await response.json();
 
             if (data.success) {
+                this.quizResult = data.result;
                 this.showQuizResults(data.result);
             }
         } catch (error) {
@@ -351,9 +421,9 @@ class StudyGuideApp {
         reviewDiv.innerHTML = '';
 
         this.currentQuestions.forEach((question, index) => {
-            const isCorrect = this.quizAnswers[index].trim().toLowerCase().includes(
-                question.answer.toLowerCase().trim()
-            );
+            // Graded on the server, which also accepts close (fuzzy) matches
+            const graded = this.quizResult && this.quizResult.questions_and_answers[index];
+            const isCorrect = Boolean(graded && graded.was_correct);
 
             const reviewItem = document.createElement('div');
             reviewItem.className = `review-item ${isCorrect ? 'correct' : 'incorrect'}`;